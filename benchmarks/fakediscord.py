@@ -0,0 +1,258 @@
+import asyncio
+import collections
+import dataclasses
+import itertools
+from typing import Callable, Union
+
+import discord
+
+import utils
+
+# Stand-ins for the Discord gateway and REST layer used by the simulator.
+# REST calls are counted by route and take rest_latency_seconds of virtual time, with a per-route/channel
+# bucket approximating Discord's rate limits. Every REST call that changes state is echoed back through the
+# gateway as the matching event, the way Discord would.
+
+MESSAGE_ROUTE = "/channels/{channel_id}/messages/{message_id}"
+REACTION_ROUTE = MESSAGE_ROUTE + "/reactions"
+
+@dataclasses.dataclass
+class FakeResponse:
+    status: int
+    reason: str
+
+@dataclasses.dataclass
+class ReactionPayload:
+    message_id: int
+    channel_id: int
+    user_id: int
+    guild_id: int
+    emoji: str
+    event_type: str
+    # Virtual time the event left the gateway, used to measure end to end latency
+    dispatched_at: float
+    member: object = None
+
+@dataclasses.dataclass
+class MessageDeletePayload:
+    message_id: int
+    channel_id: int
+    guild_id: int
+
+class FakeUser:
+    def __init__(self, user_id: int, name: str, bot: bool = False):
+        self.id = user_id
+        self.name = name
+        self.bot = bot
+        self.roles: list["FakeRole"] = []
+
+    @property
+    def mention(self) -> str:
+        return f"<@{self.id}>"
+
+    def get_role(self, role_id: int) -> Union["FakeRole", None]:
+        return next((role for role in self.roles if role.id == role_id), None)
+
+class FakeRole:
+    def __init__(self, role_id: int, name: str):
+        self.id = role_id
+        self.name = name
+        self.members: list[FakeUser] = []
+
+    @property
+    def mention(self) -> str:
+        return f"<@&{self.id}>"
+
+class FakeGuild:
+    def __init__(self, guild_id: int):
+        self.id = guild_id
+        self.roles: dict[int, FakeRole] = {}
+
+    def get_role(self, role_id: int) -> Union[FakeRole, None]:
+        return self.roles.get(role_id)
+
+class FakeMessage:
+    def __init__(self, discord_: "FakeDiscord", channel: "FakeChannel", message_id: int, author: FakeUser, content: str, embed: discord.Embed = None):
+        self.discord = discord_
+        self.channel = channel
+        self.id = message_id
+        self.author = author
+        self.content = content or ""
+        self.embeds = [embed] if embed is not None else []
+        # The bot compares this with naive timestamps from the database, so use the naive virtual time
+        self.created_at = discord_.clock.now()
+        self.guild = channel.guild
+        self.reactions: dict[str, set[int]] = collections.defaultdict(set)
+        self._state = None
+
+    @property
+    def jump_url(self) -> str:
+        return f"https://discord.com/channels/{self.guild.id}/{self.channel.id}/{self.id}"
+
+    async def add_reaction(self, emoji: str):
+        await self.discord.rest("PUT", REACTION_ROUTE, self.channel.id)
+        self.discord.react(self, self.discord.bot_user.id, str(emoji), added=True)
+
+    async def remove_reaction(self, emoji: str, member: FakeUser):
+        await self.discord.rest("DELETE", REACTION_ROUTE, self.channel.id)
+        self.discord.react(self, member.id, str(emoji), added=False)
+
+    async def clear_reactions(self):
+        await self.discord.rest("DELETE", REACTION_ROUTE, self.channel.id)
+        self.reactions.clear()
+
+    async def edit(self, content: str = None, embed: discord.Embed = None):
+        await self.discord.rest("PATCH", MESSAGE_ROUTE, self.channel.id)
+        if content is not None:
+            self.content = content
+        if embed is not None:
+            self.embeds = [embed]
+        return self
+
+    async def delete(self):
+        await self.discord.rest("DELETE", MESSAGE_ROUTE, self.channel.id)
+        self.channel.messages.pop(self.id, None)
+        self.discord.dispatch_later("raw_message_delete", MessageDeletePayload(message_id=self.id, channel_id=self.channel.id, guild_id=self.guild.id))
+
+class FakePartialMessage:
+    def __init__(self, channel: "FakeChannel", message_id: int):
+        self.channel = channel
+        self.id = int(message_id)
+
+    @property
+    def jump_url(self) -> str:
+        return f"https://discord.com/channels/{self.channel.guild.id}/{self.channel.id}/{self.id}"
+
+    def _resolve(self) -> FakeMessage:
+        message = self.channel.messages.get(self.id)
+        if message is None:
+            raise discord.NotFound(FakeResponse(404, "Not Found"), "Unknown Message")
+        return message
+
+    async def fetch(self) -> FakeMessage:
+        await self.channel.discord.rest("GET", MESSAGE_ROUTE, self.channel.id)
+        return self._resolve()
+
+    async def delete(self):
+        await self._resolve().delete()
+
+    async def edit(self, **kwargs):
+        return await self._resolve().edit(**kwargs)
+
+    async def clear_reactions(self):
+        await self._resolve().clear_reactions()
+
+    async def add_reaction(self, emoji: str):
+        await self._resolve().add_reaction(emoji)
+
+    async def remove_reaction(self, emoji: str, member: FakeUser):
+        await self._resolve().remove_reaction(emoji, member)
+
+class FakeChannel:
+    def __init__(self, discord_: "FakeDiscord", channel_id: int, guild: FakeGuild):
+        self.discord = discord_
+        self.id = channel_id
+        self.guild = guild
+        self.messages: dict[int, FakeMessage] = {}
+
+    @property
+    def jump_url(self) -> str:
+        return f"https://discord.com/channels/{self.guild.id}/{self.id}"
+
+    def get_partial_message(self, message_id: int) -> FakePartialMessage:
+        return FakePartialMessage(self, message_id)
+
+    async def send(self, content: str = None, embed: discord.Embed = None) -> FakeMessage:
+        await self.discord.rest("POST", "/channels/{channel_id}/messages", self.id)
+        return self.discord.post(self, self.discord.bot_user, content, embed=embed)
+
+class FakeDiscord:
+    def __init__(
+        self,
+        clock: utils.Clock,
+        guild_id: int,
+        rest_latency_seconds: float = 0.1,
+        gateway_latency_seconds: float = 0.05,
+        rate_limit: tuple[int, float] = (5, 5.0),
+    ):
+        self.clock = clock
+        self.rest_latency_seconds = rest_latency_seconds
+        self.gateway_latency_seconds = gateway_latency_seconds
+        self.rate_limit = rate_limit
+        self.guild = FakeGuild(guild_id)
+        self.channels: dict[int, FakeChannel] = {}
+        self.users: dict[int, FakeUser] = {}
+        self.bot_user: FakeUser = None
+        self.client: discord.Client = None
+        self.snowflakes = itertools.count(10 ** 17)
+        # REST calls made and rate limit waits, by "METHOD route"
+        self.rest_calls = collections.Counter()
+        self.rate_limit_hits = collections.Counter()
+        self.gateway_events = collections.Counter()
+        self.buckets: dict[tuple, collections.deque] = collections.defaultdict(collections.deque)
+        # Called with (message) whenever a message is posted, lets the simulated community react to the bot
+        self.message_listeners: list[Callable[[FakeMessage], None]] = []
+
+    def add_user(self, user_id: int, name: str, bot: bool = False) -> FakeUser:
+        user = FakeUser(user_id, name, bot=bot)
+        self.users[user_id] = user
+        return user
+
+    def add_role(self, role_id: int, name: str, members: list[FakeUser]) -> FakeRole:
+        role = FakeRole(role_id, name)
+        role.members = list(members)
+        for member in members:
+            member.roles.append(role)
+        self.guild.roles[role_id] = role
+        return role
+
+    def add_channel(self, channel_id: int) -> FakeChannel:
+        channel = FakeChannel(self, channel_id, self.guild)
+        self.channels[channel_id] = channel
+        return channel
+
+    async def rest(self, method: str, route: str, channel_id: int):
+        key = f"{method} {route}"
+        self.rest_calls[key] += 1
+        limit, per_seconds = self.rate_limit
+        bucket = self.buckets[(key, channel_id)]
+        loop = asyncio.get_running_loop()
+        while len(bucket) >= limit and loop.time() - bucket[0] < per_seconds:
+            # discord.py waits out the bucket before sending
+            self.rate_limit_hits[key] += 1
+            await asyncio.sleep(per_seconds - (loop.time() - bucket[0]))
+        while len(bucket) >= limit:
+            bucket.popleft()
+        bucket.append(loop.time())
+        await asyncio.sleep(self.rest_latency_seconds)
+
+    def dispatch_later(self, event: str, *args):
+        self.gateway_events[event] += 1
+        asyncio.get_running_loop().call_later(self.gateway_latency_seconds, self.client.dispatch, event, *args)
+
+    def post(self, channel: FakeChannel, author: FakeUser, content: str, embed: discord.Embed = None) -> FakeMessage:
+        message = FakeMessage(self, channel, next(self.snowflakes), author, content, embed=embed)
+        channel.messages[message.id] = message
+        self.dispatch_later("message", message)
+        for listener in self.message_listeners:
+            listener(message)
+        return message
+
+    def react(self, message: FakeMessage, user_id: int, emoji: str, added: bool = True):
+        users = message.reactions[emoji]
+        if (user_id in users) == added:
+            return
+        if added:
+            users.add(user_id)
+        else:
+            users.discard(user_id)
+        payload = ReactionPayload(
+            message_id=message.id,
+            channel_id=message.channel.id,
+            user_id=user_id,
+            guild_id=self.guild.id,
+            emoji=emoji,
+            event_type="REACTION_ADD" if added else "REACTION_REMOVE",
+            dispatched_at=asyncio.get_running_loop().time() + self.gateway_latency_seconds,
+        )
+        self.dispatch_later("raw_reaction_add" if added else "raw_reaction_remove", payload)
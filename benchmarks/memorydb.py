@@ -0,0 +1,197 @@
+import collections
+import dataclasses
+import datetime
+import itertools
+from typing import Callable, Union
+
+import model
+import utils
+
+# In-memory implementation of the DatabaseConnection interface used by the bot, for the simulator.
+# Rows are copied in and out like a real database would, and id columns stored as VARCHAR come back as strings.
+
+STRING_FIELDS = {
+    model.TaskInstance: ("channel_id", "message_id"),
+    model.TaskCompletion: ("user_id", "approver_id", "evidence_channel_id", "evidence_message_id"),
+    model.TaskVote: ("voting_channel_id", "voting_message_id"),
+}
+
+def _row(obj, **changes):
+    row = dataclasses.replace(obj, **changes)
+    for field in STRING_FIELDS.get(type(obj), ()):
+        value = getattr(row, field)
+        if value is not None:
+            setattr(row, field, str(value))
+    return row
+
+class MemoryDatabase:
+    def __init__(self, clock: utils.Clock = None):
+        self.clock = clock or utils.Clock()
+        self.tasks: dict[int, model.Task] = {}
+        self.task_instances: dict[int, model.TaskInstance] = {}
+        self.task_completions: dict[int, model.TaskCompletion] = {}
+        self.votes: dict[int, model.TaskVote] = {}
+        self.vote_options: dict[int, model.TaskVoteOption] = {}
+        self.vote_ballots: set[tuple[int, str, int]] = set()
+        self.ids = collections.defaultdict(lambda: itertools.count(1))
+        self.catalog: Union[model.TaskCatalog, None] = None
+
+    def _insert(self, table: dict, obj) -> int:
+        obj.id = next(self.ids[id(table)])
+        table[obj.id] = _row(obj)
+        return obj.id
+
+    def _update(self, table: dict, obj, fields: tuple[str, ...]):
+        if obj.id not in table:
+            return
+        fields = fields or tuple(field.name for field in dataclasses.fields(obj))
+        table[obj.id] = _row(table[obj.id], **{field: getattr(obj, field) for field in fields})
+
+    def _select(self, table: dict, predicate: Callable, key: Callable = None, reverse: bool = False) -> list:
+        rows = [_row(row) for row in table.values() if predicate(row)]
+        if key is not None:
+            rows.sort(key=key, reverse=reverse)
+        return rows
+
+    def _first(self, rows: list):
+        return rows[0] if rows else None
+
+    def get_catalog(self) -> model.TaskCatalog:
+        if self.catalog is None:
+            self.catalog = model.TaskCatalog(self.get_tasks())
+        return self.catalog
+
+    def invalidate_catalog(self):
+        self.catalog = None
+
+    def get_tasks(self):
+        return [dataclasses.replace(task) for _, task in sorted(self.tasks.items())]
+
+    def get_standard_tasks(self):
+        return self.get_catalog().standard_tasks
+
+    def get_task_by_id(self, task_id: int):
+        task = self.tasks.get(task_id)
+        return dataclasses.replace(task) if task is not None else None
+
+    def get_random_task(self):
+        return self.get_random_tasks(1)[0]
+
+    def get_random_tasks(self, ntasks: int):
+        catalog = self.get_catalog()
+        return [catalog.standard_tasks[index] for index in catalog.sample_indices(ntasks)]
+
+    def get_random_parsed_tasks(self, ntasks: int):
+        catalog = self.get_catalog()
+        return [catalog.parsed_standard_tasks[index] for index in catalog.sample_indices(ntasks)]
+
+    def insert_task(self, task: model.Task):
+        self.tasks[task.id] = dataclasses.replace(task)
+        self.invalidate_catalog()
+
+    def get_max_task_id(self):
+        return max(self.tasks, default=None)
+
+    def insert_tasks(self, tasks: list[model.Task]):
+        for task in tasks:
+            self.tasks[task.id] = dataclasses.replace(task)
+        self.invalidate_catalog()
+
+    def update_task(self, task: model.Task):
+        if task.id in self.tasks:
+            self.tasks[task.id] = dataclasses.replace(task)
+        self.invalidate_catalog()
+
+    def get_active_task_instance(self, task_type: str = model.TASK_TYPE_STANDARD):
+        now = self.clock.now()
+        return self._first(self._select(self.task_instances, lambda row: row.end_time > now and row.task_type == task_type))
+
+    def get_task_instance_by_time(self, timestamp: datetime.datetime, task_type: str = model.TASK_TYPE_STANDARD):
+        return self._first(self._select(self.task_instances, lambda row: row.end_time > timestamp and row.start_time < timestamp and row.task_type == task_type))
+
+    def get_unclaimed_tasks(self):
+        now = self.clock.now()
+        return self._select(self.task_instances, lambda row: not row.drawn_prize and row.end_time < now, key=lambda row: row.end_time)
+
+    def get_completed_tasks_between(self, start: datetime.datetime, end: datetime.datetime):
+        return self._select(self.task_instances, lambda row: start < row.end_time < end, key=lambda row: row.end_time)
+
+    def get_task_instances_by_ids(self, task_instance_ids: list[int]):
+        task_instance_ids = set(task_instance_ids)
+        return self._select(self.task_instances, lambda row: row.id in task_instance_ids, key=lambda row: row.end_time)
+
+    def create_task_instance(self, new_task: model.TaskInstance, completed_vote: model.TaskVote = None):
+        active_instance = self.get_active_task_instance(new_task.task_type)
+        if active_instance is not None:
+            active_instance.end_time = self.clock.now()
+            self._update(self.task_instances, active_instance, ("end_time",))
+        if completed_vote is not None:
+            completed_vote.completed = True
+            self._update(self.votes, completed_vote, ("completed",))
+        self._insert(self.task_instances, new_task)
+
+    def update_task_instance(self, task_instance: model.TaskInstance, *fields: str):
+        self._update(self.task_instances, task_instance, fields)
+
+    def get_most_recent_task_instance(self, task_type: str = model.TASK_TYPE_STANDARD):
+        return self._first(self._select(self.task_instances, lambda row: row.task_type == task_type, key=lambda row: row.end_time, reverse=True))
+
+    def get_task_completions(self, task_instance_id: int):
+        return self._select(self.task_completions, lambda row: row.instance_id == task_instance_id)
+
+    def get_completions_for_task_instances(self, task_instance_ids: list[int]):
+        task_instance_ids = set(task_instance_ids)
+        return self._select(self.task_completions, lambda row: row.instance_id in task_instance_ids, key=lambda row: row.id)
+
+    def add_task_completion(self, completion: model.TaskCompletion):
+        user_id = str(completion.user_id)
+        if any(row.instance_id == completion.instance_id and row.user_id == user_id for row in self.task_completions.values()):
+            return False
+        self._insert(self.task_completions, completion)
+        return True
+
+    def remove_completions_from_message(self, evidence_message_id: str):
+        removed = self._select(self.task_completions, lambda row: row.evidence_message_id == str(evidence_message_id))
+        for row in removed:
+            del self.task_completions[row.id]
+        return removed
+
+    def get_active_vote(self):
+        return self._first(self._select(self.votes, lambda row: not row.completed))
+
+    def create_vote(self, vote: model.TaskVote, options: list[model.TaskVoteOption] = None):
+        self._insert(self.votes, vote)
+        for option in options or []:
+            option.vote_id = vote.id
+            self._insert(self.vote_options, option)
+
+    def update_vote(self, vote: model.TaskVote, *fields: str):
+        self._update(self.votes, vote, fields)
+
+    def delete_vote(self, vote: model.TaskVote):
+        self.votes.pop(vote.id, None)
+        for option in self._select(self.vote_options, lambda row: row.vote_id == vote.id):
+            del self.vote_options[option.id]
+        self.vote_ballots = set(ballot for ballot in self.vote_ballots if ballot[0] != vote.id)
+
+    def get_vote_options(self, task_vote_id: int):
+        return self._select(self.vote_options, lambda row: row.vote_id == task_vote_id, key=lambda row: row.option_index)
+
+    def get_vote_option_by_id(self, option_id: int):
+        option = self.vote_options.get(option_id)
+        return _row(option) if option is not None else None
+
+    def add_vote_ballot(self, ballot: model.TaskVoteBallot):
+        self.vote_ballots.add((ballot.vote_id, str(ballot.user_id), ballot.option_index))
+
+    def remove_vote_ballot(self, ballot: model.TaskVoteBallot):
+        self.vote_ballots.discard((ballot.vote_id, str(ballot.user_id), ballot.option_index))
+
+    def get_vote_ballots(self, vote_id: int):
+        return [model.TaskVoteBallot(vote_id=ballot[0], user_id=ballot[1], option_index=ballot[2]) for ballot in self.vote_ballots if ballot[0] == vote_id]
+
+    def ping(self):
+        return 1
+
+    def initialize(self):
+        pass
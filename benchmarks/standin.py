@@ -0,0 +1,52 @@
+import contextlib
+from typing import Callable
+
+# In-process stand-in for a psycopg2 connection, so the Python side of the database helpers can be measured without Postgres.
+# respond(query, vars) returns the rows for a statement.
+
+class StandInCursor:
+    def __init__(self, connection: "StandInConnection"):
+        self.connection = connection
+        self.rows = []
+
+    def execute(self, query: str, vars=None):
+        self.connection.statement_count += 1
+        self.rows = self.connection.respond(query, vars)
+
+    def fetchone(self):
+        return self.rows[0] if self.rows else None
+
+    def fetchall(self):
+        return self.rows
+
+    def close(self):
+        pass
+
+class StandInConnection:
+    def __init__(self, respond: Callable[[str, tuple], list[tuple]] = None, prepared: bool = False):
+        self.respond = respond or (lambda query, vars: [(1,)])
+        self.statement_count = 0
+        # Only set when exercising the prepared statement path, in which case respond sees PREPARE/EXECUTE statements
+        if prepared:
+            self.prepared_statements: set[str] = set()
+
+    def cursor(self) -> StandInCursor:
+        return StandInCursor(self)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+class StandInPool:
+    def __init__(self, connection: StandInConnection):
+        self.max_size = 1
+        self._connection = connection
+
+    @contextlib.contextmanager
+    def connection(self):
+        yield self._connection
+
+    def close(self):
+        pass
@@ -0,0 +1,75 @@
+import asyncio
+import concurrent.futures
+import datetime
+import heapq
+import selectors
+
+import utils
+
+# Virtual time for the simulator: the event loop jumps straight to the next timer instead of sleeping,
+# so asyncio.sleep/wait_for and everything scheduled by the bot run in simulated time.
+
+class VirtualTimeSelector:
+    def __init__(self, loop: "VirtualTimeEventLoop", selector: selectors.BaseSelector):
+        self.loop = loop
+        self.selector = selector
+
+    def select(self, timeout: float = None):
+        # Real readiness (the loop's self-pipe) still wins, otherwise advance to the next timer without blocking
+        events = self.selector.select(0)
+        if events or timeout is None:
+            return events or self.selector.select(timeout)
+        self.loop.advance(timeout)
+        return []
+
+    def __getattr__(self, name: str):
+        return getattr(self.selector, name)
+
+class VirtualTimeEventLoop(asyncio.SelectorEventLoop):
+    def __init__(self):
+        self.virtual_time = 0.0
+        super().__init__(VirtualTimeSelector(self, selectors.DefaultSelector()))
+
+    def time(self) -> float:
+        return self.virtual_time
+
+    def advance(self, seconds: float):
+        self.virtual_time += max(seconds, 0)
+
+class VirtualClock(utils.Clock):
+    def __init__(self, loop: VirtualTimeEventLoop, start: datetime.datetime):
+        self.loop = loop
+        self.start = start
+
+    def now(self) -> datetime.datetime:
+        return self.start + datetime.timedelta(seconds=self.loop.time())
+
+class SimulatedExecutor(concurrent.futures.Executor):
+    # Stands in for AsyncDatabaseConnection's thread pool. Calls run immediately but complete latency_seconds later
+    # in virtual time on the first free worker, so pool saturation shows up as queueing like it would in production.
+    def __init__(self, loop: VirtualTimeEventLoop, worker_count: int, latency_seconds: float = 0):
+        self.loop = loop
+        self.latency_seconds = latency_seconds
+        self.free_at = [0.0] * max(worker_count, 1)
+        self.pending = 0
+
+    def submit(self, fn, *args, **kwargs) -> concurrent.futures.Future:
+        future = concurrent.futures.Future()
+        start = max(self.loop.time(), heapq.heappop(self.free_at))
+        done = start + self.latency_seconds
+        heapq.heappush(self.free_at, done)
+        try:
+            outcome = (fn(*args, **kwargs), None)
+        except BaseException as e:
+            outcome = (None, e)
+        self.pending += 1
+        self.loop.call_at(done, self._complete, future, outcome)
+        return future
+
+    def _complete(self, future: concurrent.futures.Future, outcome: tuple):
+        self.pending -= 1
+        result, exception = outcome
+        if exception is not None:
+            future.set_exception(exception)
+        else:
+            future.set_result(result)
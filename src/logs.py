@@ -0,0 +1,114 @@
+import asyncio
+import contextlib
+import contextvars
+import copy
+import datetime
+import json
+import logging
+import logging.handlers
+import queue
+from typing import Union
+
+import metrics
+
+# Logging goes through a bounded queue to a listener thread that formats and writes the records,
+# so a logging call on the event loop never waits on the disk.
+# Records are JSON lines, carrying the correlation fields set with log_context() or passed in extra=.
+
+CORRELATION_FIELDS = ("vote_id", "task_instance_id", "message_id", "user_id")
+QUEUE_SIZE = 10000
+
+_log_context: contextvars.ContextVar[dict] = contextvars.ContextVar("log_context", default={})
+
+@contextlib.contextmanager
+def log_context(**fields):
+    # Fields apply to every record logged in this block, including from coroutines it awaits
+    token = _log_context.set({**_log_context.get(), **{name: value for name, value in fields.items() if value is not None}})
+    try:
+        yield
+    finally:
+        _log_context.reset(token)
+
+class ContextFilter(logging.Filter):
+    # Runs on the logging thread/task before the record is queued, since the listener thread can't see its context
+    def filter(self, record: logging.LogRecord) -> bool:
+        for name, value in _log_context.get().items():
+            if not hasattr(record, name):
+                setattr(record, name, value)
+        try:
+            task = asyncio.current_task()
+        except RuntimeError:
+            task = None
+        if task is not None:
+            record.task_name = task.get_name()
+        return True
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.datetime.fromtimestamp(record.created, tz=datetime.timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "thread": record.threadName,
+        }
+        task_name = getattr(record, "task_name", None)
+        if task_name is not None:
+            entry["task"] = task_name
+        for name in CORRELATION_FIELDS:
+            value = getattr(record, name, None)
+            if value is not None:
+                entry[name] = str(value)
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        if record.stack_info:
+            entry["stack"] = record.stack_info
+        return json.dumps(entry, ensure_ascii=False)
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Keep the record structured (QueueHandler's default flattens it into a formatted string), but resolve the
+        # message and traceback now so the queued record holds no references to live objects
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            # The writer can't keep up, drop rather than block the caller
+            metrics.LOG_RECORDS_DROPPED.inc()
+
+def create_file_handler(filename: str, max_bytes: int, backup_count: int, rotate_when: Union[str, None]) -> logging.Handler:
+    if rotate_when:
+        return logging.handlers.TimedRotatingFileHandler(filename, when=rotate_when, backupCount=backup_count, encoding="utf-8")
+    return logging.handlers.RotatingFileHandler(filename, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8")
+
+def configure_logging(
+    filename: str,
+    level: int = logging.INFO,
+    max_bytes: int = 10 * 1024 * 1024,
+    backup_count: int = 5,
+    rotate_when: str = None,
+) -> logging.handlers.QueueListener:
+    file_handler = create_file_handler(filename, max_bytes, backup_count, rotate_when)
+    file_handler.setFormatter(JsonFormatter())
+    queue_handler = DroppingQueueHandler(queue.Queue(maxsize=QUEUE_SIZE))
+    queue_handler.addFilter(ContextFilter())
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    listener = logging.handlers.QueueListener(queue_handler.queue, file_handler, respect_handler_level=True)
+    listener.start()
+    return listener
@@ -1,5 +1,6 @@
 import asyncio
 import argparse
+import atexit
 from collections import defaultdict
 import dataclasses
 import datetime
@@ -9,14 +10,21 @@ import json
 import logging
 import math
 import os
-import random
+import time
 import traceback
 import re
 
 from discord.message import Message
+from typing import Awaitable, Union
 from discord.reaction import Reaction
 
+import logs
+import metrics
 import model
+import profiling
+import scheduler
+import stats
+import tasklist
 import templates
 import utils
 
@@ -36,10 +44,28 @@ class BotConfig:
     community_role_id: int
     winner_task_count: int
     log_filename: str
+    # Size based rotation unless log_rotate_when is set (a TimedRotatingFileHandler interval, e.g. "midnight")
+    log_max_bytes: int = 10 * 1024 * 1024
+    log_backup_count: int = 5
+    log_rotate_when: str = None
+    message_cache_size: int = 1000
+    approval_worker_count: int = 8
+    log_flush_seconds: float = 2
+    database_min_connections: int = 1
+    database_max_connections: int = 4
+    tasks_cache_filename: str = None
+    winner_weighting: str = stats.WINNER_WEIGHTING_COMPLETION
+    winner_bonus_multiplier: int = 1
+    # Serves /metrics, /healthz and /readyz (the docker-compose healthcheck probes 9100), null disables it
+    metrics_port: int = 9100
+    metrics_host: str = "127.0.0.1"
+    loop_lag_interval_seconds: float = 0.5
+    slow_callback_seconds: float = 0.25
+    profile_directory: str = "profiles"
 
 @dataclasses.dataclass
 class BotContext:
-    database: model.DatabaseConnection
+    database: model.AsyncDatabaseConnection
     announcement_channel: discord.TextChannel
     submission_channel: discord.TextChannel
 
@@ -59,13 +85,14 @@ def get_config_from_args() -> BotConfig:
         database_dsn=os.environ["DB_URI"],
         voting_task_count=3,
     )
-    logging.basicConfig(
-        filename=config.log_filename,
-        filemode='a',
-        format='%(asctime)s,%(msecs)d %(name)s %(levelname)s %(message)s',
-        datefmt='%H:%M:%S',
-        level=logging.INFO,
+    listener = logs.configure_logging(
+        config.log_filename,
+        max_bytes=config.log_max_bytes,
+        backup_count=config.log_backup_count,
+        rotate_when=config.log_rotate_when,
     )
+    # Flush whatever is still queued on exit
+    atexit.register(listener.stop)
     return config
 
 # Initialize bot
@@ -80,72 +107,264 @@ def get_task_type_from_message(message: discord.Message) -> str:
     return model.TASK_TYPE_STANDARD
 
 class BotLogger:
-    def __init__(self, channel: discord.TextChannel):
+    # Log channel messages are queued and posted in batches by a background task, so callers never wait on Discord
+    def __init__(self, channel: discord.TextChannel, flush_seconds: float = 2, max_lines: int = 20, max_queue_size: int = 1000):
         self.channel = channel
+        self.flush_seconds = flush_seconds
+        self.max_lines = max_lines
+        self.queue: asyncio.Queue[str] = asyncio.Queue(maxsize=max_queue_size)
+        self.task: Union[asyncio.Task, None] = None
+
+    def start(self):
+        if self.channel is not None and self.task is None:
+            self.task = asyncio.create_task(self._run())
 
     async def info(self, msg: str):
         logging.info(msg)
         if self.channel is not None:
-            await self.channel.send(msg)
+            try:
+                self.queue.put_nowait(msg)
+            except asyncio.QueueFull:
+                metrics.LOG_CHANNEL_DROPPED.inc()
+                logging.warning(f"Log channel queue full, dropping message: {msg}")
+
+    async def _next_batch(self) -> list[str]:
+        lines = [await self.queue.get()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.flush_seconds
+        while len(lines) < self.max_lines:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                lines.append(await asyncio.wait_for(self.queue.get(), timeout=timeout))
+            except asyncio.TimeoutError:
+                break
+        return lines
+
+    async def _send(self, content: str):
+        for attempt in range(5):
+            try:
+                await self.channel.send(content)
+                return
+            except discord.HTTPException as e:
+                if e.status != 429:
+                    logging.exception("Failed to send to log channel")
+                    return
+                # discord.py already retried, back off harder before trying again
+                await asyncio.sleep(2 ** attempt)
+        metrics.LOG_CHANNEL_DROPPED.inc()
+        logging.error(f"Dropping log channel message after repeated rate limits: {content}")
+
+    async def _run(self):
+        while True:
+            lines = await self._next_batch()
+            for chunk in utils.chunk_lines(lines):
+                await self._send(chunk)
 
 class BingoBot(commands.Bot):
+    def __init__(self, *args, clock: utils.Clock = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.clock = clock or utils.Clock()
+        self.scheduler = scheduler.DeadlineScheduler(self.compute_scheduled_jobs, clock=self.clock)
+        self.scheduler_task: Union[asyncio.Task, None] = None
+        self.message_cache = utils.MessageCache(config.message_cache_size)
+        self.vote_tally: Union[stats.VoteTally, None] = None
+        self.approval_pool = utils.KeyedWorkerPool(config.approval_worker_count)
+        self.ballot_pool = utils.KeyedWorkerPool()
+        self.logger: Union[BotLogger, None] = None
+        # guild id -> ids of members holding the admin role, kept in sync from member and role events
+        self.admin_user_ids: dict[int, set[int]] = {}
+        self.metrics_runner = None
+        self.loop_monitor = profiling.LoopMonitor(config.loop_lag_interval_seconds, config.slow_callback_seconds)
+        self.profiling = False
+
+    async def setup_hook(self):
+        self.loop_monitor.start()
+        if config.metrics_port is not None:
+            self.metrics_runner = await metrics.start_server(config.metrics_host, config.metrics_port, check_ready)
+
+    async def on_message(self, message: discord.Message):
+        self.message_cache.add(message)
+        await self.process_commands(message)
+
+    async def on_raw_message_delete(self, payload: discord.RawMessageDeleteEvent):
+        self.message_cache.remove(payload.message_id)
+
+    async def on_raw_message_edit(self, payload: discord.RawMessageUpdateEvent):
+        # A copy fetched over REST isn't updated by discord.py, so drop it and fetch the edited message when it's next needed
+        # (e.g. a submission edited to add the "Bonus" prefix)
+        self.message_cache.remove(payload.message_id)
+
+    async def fetch_message(self, channel: discord.TextChannel, message_id: int) -> discord.Message:
+        message = self.message_cache.get(message_id)
+        if message is None:
+            message = await channel.get_partial_message(int(message_id)).fetch()
+            self.message_cache.add(message, replace=False)
+        return message
+
+    def index_admins(self, guild: discord.Guild):
+        role = guild.get_role(config.admin_role_id)
+        self.admin_user_ids[guild.id] = set(member.id for member in role.members) if role is not None else set()
+
+    async def on_guild_join(self, guild: discord.Guild):
+        self.index_admins(guild)
+
+    async def on_member_update(self, before: discord.Member, after: discord.Member):
+        admin_user_ids = self.admin_user_ids.setdefault(after.guild.id, set())
+        if is_bingo_admin(after):
+            admin_user_ids.add(after.id)
+        else:
+            admin_user_ids.discard(after.id)
+
+    async def on_raw_member_remove(self, payload: discord.RawMemberRemoveEvent):
+        self.admin_user_ids.get(payload.guild_id, set()).discard(payload.user.id)
+
+    async def on_guild_role_delete(self, role: discord.Role):
+        if role.id == config.admin_role_id:
+            self.admin_user_ids[role.guild.id] = set()
+
     async def on_ready(self):
+        for guild in self.guilds:
+            self.index_admins(guild)
         g_context.announcement_channel = self.get_channel(config.announcement_channel_id)
         g_context.submission_channel = self.get_channel(config.submission_channel_id)
-        log_channel = self.get_channel(config.log_channel_id) if config.log_channel_id is not None else None
-        self.logger = BotLogger(log_channel)
-        self.loop.create_task(self.reaction_added_watcher())
-        self.loop.create_task(self.reaction_removed_watcher())
-        self.loop.create_task(self.vote_start_watcher())
-        self.loop.create_task(self.vote_ended_watcher())
+        if self.logger is None:
+            log_channel = self.get_channel(config.log_channel_id) if config.log_channel_id is not None else None
+            self.logger = BotLogger(log_channel, flush_seconds=config.log_flush_seconds)
+            self.logger.start()
+        self.approval_pool.start()
+        self.ballot_pool.start()
         # self.loop.create_task(self.winner_watcher())
-        self.loop.create_task(self.task_start_watcher())
+        # on_ready fires again on every reconnect, a second scheduler loop could run the same job twice
+        if self.scheduler_task is None:
+            self.scheduler_task = asyncio.create_task(self.scheduler.run())
+        # Reactions made while the bot was offline only show up on the message
+        await self.restore_vote_tally(reconcile=True)
         logging.info("Bot online")
 
-    async def vote_start_watcher(self):
-        while True:
-            active_task = g_context.database.get_active_task_instance()
-            active_vote = g_context.database.get_active_vote()
-            if active_task is not None and active_vote is None:
-                now = datetime.datetime.now()
-                if now + datetime.timedelta(seconds=config.voting_time_seconds) > active_task.end_time:
-                    await start_new_vote()
-                    bonus_task = g_context.database.get_active_task_instance(task_type=model.TASK_TYPE_BONUS)
-                    if bonus_task is not None:
-                        await post_task_instance(bonus_task)
-            await asyncio.sleep(10)
-
-    async def task_start_watcher(self):
-        while True:
-            active_vote = g_context.database.get_active_vote()
-            if active_vote is not None and active_vote.selected_option_id is not None:
-                now = datetime.datetime.now()
-                if now - datetime.timedelta(seconds=config.task_start_delay_seconds) > active_vote.end_time:
-                    selected_option = g_context.database.get_vote_option_by_id(active_vote.selected_option_id)
-                    selected_task = g_context.database.get_task_by_id(selected_option.task_id)
-
-                    active_vote.completed = True
-                    g_context.database.update_vote(active_vote)
-
-                    new_task = await start_task(selected_task, evaluated_task=selected_option.evaluated_task)
-                    logging.info(f"Vote finished, winning index {selected_option.option_index}")
-                    logging.info(f"Selected task: {new_task.evaluated_task} (TaskId={selected_task.id}) (TaskInstanceId={new_task.id})")
-
-                    vote_message = g_context.announcement_channel.get_partial_message(active_vote.voting_message_id)
-                    if vote_message is not None:
-                        try:
-                            await vote_message.delete()
-                        except discord.NotFound:
-                            pass
-            await asyncio.sleep(10)
-
-    async def vote_ended_watcher(self):
-        while True:
-            now = datetime.datetime.now()
-            active_vote = g_context.database.get_active_vote()
-            if active_vote is not None and active_vote.end_time < now:
-                await finish_vote(active_vote)
-            await asyncio.sleep(10)
+    async def fetch_vote_voters(self, vote: model.TaskVote, option_count: int) -> list[set[int]]:
+        # Users reacting with each option's number on the vote message
+        message = await self.get_channel(int(vote.voting_channel_id)).get_partial_message(int(vote.voting_message_id)).fetch()
+        voters = [set() for _ in range(option_count)]
+        for reaction in message.reactions:
+            emoji = str(reaction.emoji)
+            if emoji in number_reactions[:option_count]:
+                voters[number_reactions.index(emoji)] = set([user.id async for user in reaction.users() if user.id != self.user.id])
+        return voters
+
+    async def restore_vote_tally(self, reconcile: bool = False):
+        if self.vote_tally is not None and self.vote_tally.vote_id is None:
+            # start_new_vote is still storing the vote, its tally is already current
+            return
+        database = g_context.database
+        active_vote = await database.get_active_vote()
+        if active_vote is None or active_vote.selected_option_id is not None:
+            self.vote_tally = None
+            return
+        vote_options = await database.get_vote_options(active_vote.id)
+        tally = stats.VoteTally(active_vote.id, active_vote.voting_message_id, len(vote_options))
+        for ballot in await database.get_vote_ballots(active_vote.id):
+            tally.add(ballot.option_index, int(ballot.user_id))
+        self.vote_tally = tally
+        if not reconcile:
+            return
+        # Gateway events keep updating the tally during the fetch, add() and remove() skip the pairs they already changed
+        stored_voters = [set(voters) for voters in tally.voters]
+        try:
+            message_voters = await self.fetch_vote_voters(active_vote, len(vote_options))
+        except discord.NotFound:
+            return
+        if self.vote_tally is not tally:
+            return
+        for option_index, voters in enumerate(message_voters):
+            for user_id in voters - stored_voters[option_index]:
+                if tally.add(option_index, user_id):
+                    await self.write_ballot(model.TaskVoteBallot(vote_id=tally.vote_id, user_id=str(user_id), option_index=option_index), added=True)
+            for user_id in stored_voters[option_index] - voters:
+                if tally.remove(option_index, user_id):
+                    await self.write_ballot(model.TaskVoteBallot(vote_id=tally.vote_id, user_id=str(user_id), option_index=option_index), added=False)
+
+    async def write_ballot(self, ballot: model.TaskVoteBallot, added: bool):
+        # Writes for the same ballot run in order on one worker, so a quick add and remove can't commit out of order
+        write = g_context.database.add_vote_ballot if added else g_context.database.remove_vote_ballot
+        await self.ballot_pool.submit((ballot.vote_id, str(ballot.user_id), ballot.option_index), lambda: write(ballot))
+
+    def get_vote_ballot(self, payload: discord.RawReactionActionEvent) -> Union[model.TaskVoteBallot, None]:
+        tally = self.vote_tally
+        if tally is None or str(payload.message_id) != tally.voting_message_id or payload.user_id == self.user.id:
+            return None
+        emoji = str(payload.emoji)
+        if emoji not in number_reactions:
+            return None
+        return model.TaskVoteBallot(vote_id=tally.vote_id, user_id=str(payload.user_id), option_index=number_reactions.index(emoji))
+
+    async def on_raw_reaction_add(self, payload: discord.RawReactionActionEvent):
+        if self.is_approval_reaction(payload):
+            # Keyed by message so an approval and its removal are processed in order
+            received = time.perf_counter()
+            await self.approval_pool.submit(payload.message_id, lambda: self.timed_approval("added", payload, received, self.handle_approval_added(payload)))
+            return
+        ballot = self.get_vote_ballot(payload)
+        # vote_id is None while start_new_vote is still storing the vote, it stores the counted ballots itself
+        if ballot is not None and self.vote_tally.add(ballot.option_index, payload.user_id) and ballot.vote_id is not None:
+            await self.write_ballot(ballot, added=True)
+
+    async def on_raw_reaction_remove(self, payload: discord.RawReactionActionEvent):
+        if self.is_approval_reaction(payload):
+            received = time.perf_counter()
+            await self.approval_pool.submit(payload.message_id, lambda: self.timed_approval("removed", payload, received, self.handle_approval_removed(payload)))
+            return
+        ballot = self.get_vote_ballot(payload)
+        if ballot is not None and self.vote_tally.remove(ballot.option_index, payload.user_id) and ballot.vote_id is not None:
+            await self.write_ballot(ballot, added=False)
+
+    async def compute_scheduled_jobs(self) -> list[scheduler.ScheduledJob]:
+        jobs = []
+        active_vote = await g_context.database.get_active_vote()
+        if active_vote is None:
+            active_task = await g_context.database.get_active_task_instance()
+            if active_task is not None:
+                jobs.append(scheduler.ScheduledJob(
+                    key=("start_vote", active_task.id),
+                    due_time=active_task.end_time - datetime.timedelta(seconds=config.voting_time_seconds),
+                    callback=self.start_vote_job,
+                ))
+        elif active_vote.selected_option_id is None:
+            jobs.append(scheduler.ScheduledJob(
+                key=("finish_vote", active_vote.id),
+                due_time=active_vote.end_time,
+                callback=lambda: finish_vote(active_vote),
+            ))
+        else:
+            jobs.append(scheduler.ScheduledJob(
+                key=("start_task", active_vote.id),
+                due_time=active_vote.end_time + datetime.timedelta(seconds=config.task_start_delay_seconds),
+                callback=lambda: self.start_task_job(active_vote),
+            ))
+        return jobs
+
+    async def start_vote_job(self):
+        await start_new_vote()
+        bonus_task = await g_context.database.get_active_task_instance(task_type=model.TASK_TYPE_BONUS)
+        if bonus_task is not None:
+            await post_task_instance(bonus_task)
+
+    async def start_task_job(self, active_vote: model.TaskVote):
+        with logs.log_context(vote_id=active_vote.id):
+            selected_option = await g_context.database.get_vote_option_by_id(active_vote.selected_option_id)
+            selected_task = await g_context.database.get_task_by_id(selected_option.task_id)
+
+            new_task = await start_task(selected_task, evaluated_task=selected_option.evaluated_task, completed_vote=active_vote)
+            logging.info(f"Vote finished, winning index {selected_option.option_index}")
+            logging.info(f"Selected task: {new_task.evaluated_task} (TaskId={selected_task.id}) (TaskInstanceId={new_task.id})")
+
+            vote_message = g_context.announcement_channel.get_partial_message(active_vote.voting_message_id)
+            if vote_message is not None:
+                try:
+                    await vote_message.delete()
+                except discord.NotFound:
+                    pass
 
     # async def winner_watcher(self):
     #     while True:
@@ -176,97 +395,93 @@ class BingoBot(commands.Bot):
     #                 g_context.database.update_task_instance(task)
     #         await asyncio.sleep(60)
 
-    async def reaction_added_watcher(self):
-        while True:
-            reaction: discord.RawReactionActionEvent = await self.wait_for("raw_reaction_add")
-            if reaction.user_id != self.user.id and reaction.channel_id == g_context.submission_channel.id and is_user_id_bingo_admin(reaction.guild_id, reaction.user_id):
-                message = self.get_channel(reaction.channel_id).get_partial_message(reaction.message_id)
-                try:
-                    message = await message.fetch()
-                except discord.errors.NotFound:
-                    return
-                if message.author.id != self.user.id:
-                    active_task = g_context.database.get_task_instance_by_time(message.created_at, task_type=get_task_type_from_message(message))
-                    if active_task is not None:
-                        completion = model.TaskCompletion(
-                            id=None,
-                            instance_id=active_task.id,
-                            user_id=message.author.id,
-                            approver_id=reaction.user_id,
-                            completion_time=message.created_at,
-                            evidence_channel_id=reaction.channel_id,
-                            evidence_message_id=reaction.message_id,
-                        )
-                        user = self.get_user(completion.user_id)
-                        approver = self.get_user(completion.approver_id)
-                        if g_context.database.add_task_completion(completion):
-                            await message.add_reaction(BOT_ACKNOWLEDGE_REACTION)
-                            await self.logger.info(f"Added completion for user {user.mention} (Approved by {approver.mention}) (Type={active_task.task_type})")
-                        else:
-                            await self.logger.info(f"Task has already been completed by {user.mention}")
+    async def timed_approval(self, action: str, reaction: discord.RawReactionActionEvent, received: float, handler: Awaitable[None]):
+        # Measured from the gateway event, so time spent queued behind other approvals counts
+        try:
+            with logs.log_context(message_id=reaction.message_id, user_id=reaction.user_id):
+                await handler
+        finally:
+            metrics.APPROVAL_LATENCY_SECONDS.observe(time.perf_counter() - received, action)
+
+    def is_approval_reaction(self, reaction: discord.RawReactionActionEvent) -> bool:
+        if g_context.submission_channel is None:
+            return False
+        # Cheap id comparisons first, the admin check only runs for reactions in the submission channel
+        return reaction.channel_id == g_context.submission_channel.id and reaction.user_id != self.user.id and is_user_id_bingo_admin(reaction.guild_id, reaction.user_id)
+
+    async def handle_approval_added(self, reaction: discord.RawReactionActionEvent):
+        try:
+            message = await self.fetch_message(self.get_channel(reaction.channel_id), reaction.message_id)
+        except discord.errors.NotFound:
+            return
+        if message.author.id != self.user.id:
+            active_task = await g_context.database.get_task_instance_by_time(message.created_at, task_type=get_task_type_from_message(message))
+            if active_task is not None:
+                with logs.log_context(task_instance_id=active_task.id):
+                    completion = model.TaskCompletion(
+                        id=None,
+                        instance_id=active_task.id,
+                        user_id=message.author.id,
+                        approver_id=reaction.user_id,
+                        completion_time=message.created_at,
+                        evidence_channel_id=reaction.channel_id,
+                        evidence_message_id=reaction.message_id,
+                    )
+                    user = self.get_user(completion.user_id)
+                    approver = self.get_user(completion.approver_id)
+                    if await g_context.database.add_task_completion(completion):
+                        await message.add_reaction(BOT_ACKNOWLEDGE_REACTION)
+                        await self.logger.info(f"Added completion for user {user.mention} (Approved by {approver.mention}) (Type={active_task.task_type})")
                     else:
-                        await self.logger.info(f"No active task to approve")
+                        await self.logger.info(f"Task has already been completed by {user.mention}")
+            else:
+                await self.logger.info(f"No active task to approve")
+
+    async def handle_approval_removed(self, reaction: discord.RawReactionActionEvent):
+        try:
+            message = await self.fetch_message(self.get_channel(reaction.channel_id), reaction.message_id)
+        except discord.errors.NotFound:
+            return
+        if message.author.id != self.user.id:
+            completions = await g_context.database.remove_completions_from_message(message.id)
+            await message.remove_reaction(BOT_ACKNOWLEDGE_REACTION, self.user)
+            for completion in completions:
+                user = self.get_user(int(completion.user_id))
+                approver = self.get_user(int(completion.approver_id))
+                await self.logger.info(f"Removed completion for user {user.mention} (Approved by {approver.mention})")
 
-    async def reaction_removed_watcher(self):
-        while True:
-            reaction: discord.RawReactionActionEvent = await self.wait_for("raw_reaction_remove")
-            if reaction.user_id != self.user.id and reaction.channel_id == g_context.submission_channel.id and is_user_id_bingo_admin(reaction.guild_id, reaction.user_id):
-                message = self.get_channel(reaction.channel_id).get_partial_message(reaction.message_id)
-                try:
-                    message = await message.fetch()
-                except discord.errors.NotFound:
-                    return
-                if message.author.id != self.user.id:
-                    completions = g_context.database.remove_completions_from_message(message.id)
-                    await message.remove_reaction(BOT_ACKNOWLEDGE_REACTION, self.user)
-                    for completion in completions:
-                        user = self.get_user(int(completion.user_id))
-                        approver = self.get_user(int(completion.approver_id))
-                        await self.logger.info(f"Removed completion for user {user.mention} (Approved by {approver.mention})")
-
-config = get_config_from_args()
-bot_token = read_discord_token(config)
 description = """Discord osrs bot"""
-bot = BingoBot(
-    intents=discord.Intents.all(),
-    command_prefix=COMMAND_PREFIX,
-    description=description,
-    case_insensitive=True,
-)
-
-g_context = BotContext(
-    database=model.DatabaseConnection(config.database_dsn),
-    announcement_channel=None,
-    submission_channel=None,
-)
-g_context.database.initialize()
-with open(config.tasks_filename, "r") as f:
-    tasks = f.readlines()
-parsed_tasks = []
-for index, task in enumerate(tasks):
-    parts = task.split(";")
-    if len(parts) == 2:
-        parsed_tasks.append(
-            model.Task(
-                id=index + 1,
-                description=parts[0],
-                weight=1,
-                instruction=parts[1],
-            )
-        )
-g_context.database.insert_tasks(parsed_tasks)
+
+# Filled in by setup(), so importing this module has no side effects
+config: BotConfig = None
+bot: BingoBot = None
+g_context: BotContext = None
+bot_commands: list[commands.Command] = []
+
+def bot_command(**kwargs):
+    # Commands are collected here and added to the bot in setup()
+    def decorator(func):
+        command = commands.command(**kwargs)(func)
+        bot_commands.append(command)
+        return command
+    return decorator
 
 # Helper methods
 
+async def check_ready() -> tuple[bool, str]:
+    if not bot.is_ready():
+        return False, "Not connected to Discord"
+    try:
+        await asyncio.wait_for(g_context.database.ping(), timeout=5)
+    except Exception as e:
+        return False, f"Database unavailable: {e!r}"
+    return True, "ok"
+
 def is_bingo_admin(user: discord.Member):
     return bool(user.get_role(config.admin_role_id))
 
 def is_user_id_bingo_admin(guild_id: int, user_id: int):
-    guild = bot.get_guild(guild_id)
-    user = guild.get_member(user_id)
-    if user is not None:
-        return is_bingo_admin(user)
-    return False
+    return user_id in bot.admin_user_ids.get(guild_id, ())
 
 number_reactions = [
     "1️⃣",
@@ -281,22 +496,15 @@ number_reactions = [
 ]
 
 async def end_task(task_instance: model.TaskInstance):
-    g_context.database.update_task_instance(task_instance)
-
     channel = g_context.announcement_channel
     if task_instance.message_id is not None:
-        message = channel.get_partial_message(task_instance.message_id)
-        if not message:
-            return
+        # Deleting doesn't need the message contents, so skip fetching it
+        message = channel.get_partial_message(int(task_instance.message_id))
+        bot.message_cache.remove(message.id)
         try:
-            message = await message.fetch()
+            await message.delete()
         except discord.errors.NotFound:
             return
-        if message is not None:
-            try:
-                await message.delete()
-            except discord.errors.NotFound:
-                return
 
     # task = g_context.database.get_task_by_id(task_instance.task_id)
     # embed = discord.Embed(title="Ended Task")
@@ -305,13 +513,15 @@ async def end_task(task_instance: model.TaskInstance):
     # await message.edit(embed=embed)
 
 async def cancel_vote(vote: model.TaskVote):
+    bot.vote_tally = None
     channel = g_context.announcement_channel
     message = channel.get_partial_message(vote.voting_message_id)
     try:
         await message.delete()
     except discord.errors.NotFound:
         pass
-    g_context.database.delete_vote(vote)
+    await g_context.database.delete_vote(vote)
+    bot.scheduler.rearm()
 
 TASK_TYPE_TITLE = {
     model.TASK_TYPE_STANDARD: "Current Task",
@@ -324,7 +534,7 @@ TASK_TYPE_COLOR = {
 }
 
 async def post_task_instance(task_instance: model.TaskInstance):
-    task = g_context.database.get_task_by_id(task_instance.task_id)
+    task = await g_context.database.get_task_by_id(task_instance.task_id)
     if not task:
         return False
 
@@ -343,16 +553,17 @@ async def post_task_instance(task_instance: model.TaskInstance):
     embed.description = task_description
     embed.color = TASK_TYPE_COLOR[task_instance.task_type]
     task_message = await g_context.announcement_channel.send(content=content, embed=embed)
+    bot.message_cache.add(task_message, replace=False)
 
     task_instance.message_id = task_message.id
     task_instance.channel_id = g_context.announcement_channel.id
-    g_context.database.update_task_instance(task_instance)
+    await g_context.database.update_task_instance(task_instance, "message_id", "channel_id")
 
-async def start_task(selected_task: model.Task, evaluated_task: str):
-    task_start_time = datetime.datetime.now()
+async def start_task(selected_task: model.Task, evaluated_task: str, completed_vote: model.TaskVote = None):
+    task_start_time = bot.clock.now()
     task_end_time = utils.round_datetime(task_start_time + datetime.timedelta(seconds=config.task_duration_seconds))
 
-    previous_task = g_context.database.get_most_recent_task_instance()
+    previous_task = await g_context.database.get_most_recent_task_instance()
     new_task = model.TaskInstance(
         id=None,
         task_id=selected_task.id,
@@ -364,95 +575,91 @@ async def start_task(selected_task: model.Task, evaluated_task: str):
         message_id=None,
         drawn_prize=False,
     )
-    g_context.database.create_task_instance(new_task)
+    await g_context.database.create_task_instance(new_task, completed_vote=completed_vote)
+    bot.scheduler.rearm()
 
     await post_task_instance(new_task)
 
     if previous_task is not None:
         await end_task(previous_task)
-    previous_bonus_task = g_context.database.get_most_recent_task_instance(task_type=model.TASK_TYPE_BONUS)
+    previous_bonus_task = await g_context.database.get_most_recent_task_instance(task_type=model.TASK_TYPE_BONUS)
     if previous_bonus_task is not None:
         await end_task(previous_bonus_task)
     return new_task
 
 async def create_bonus_task(task_description: str, task_instruction: str):
-    active_standard_task = g_context.database.get_active_task_instance(task_type=model.TASK_TYPE_STANDARD)
+    active_standard_task = await g_context.database.get_active_task_instance(task_type=model.TASK_TYPE_STANDARD)
     if not active_standard_task:
         return None
 
     task = model.Task(
-        id=max(100000, g_context.database.get_max_task_id() + 1),
+        id=max(model.BONUS_TASK_MIN_ID, await g_context.database.get_max_task_id() + 1),
         description=task_description,
         instruction=task_instruction,
         weight=0,
     )
     parsed_task = model.ParsedTask.from_task(task)
-    g_context.database.insert_task(task)
-    previous_task = g_context.database.get_most_recent_task_instance(task_type=model.TASK_TYPE_BONUS)
+    await g_context.database.insert_task(task)
+    previous_task = await g_context.database.get_most_recent_task_instance(task_type=model.TASK_TYPE_BONUS)
 
     new_task_instance = model.TaskInstance(
         id=None,
         task_id=task.id,
         task_type=model.TASK_TYPE_BONUS,
         evaluated_task=parsed_task.description.evaluate(),
-        start_time=datetime.datetime.now(),
+        start_time=bot.clock.now(),
         end_time=active_standard_task.end_time,
         channel_id=None,
         message_id=None,
         drawn_prize=False,
     )
-    g_context.database.create_task_instance(new_task_instance)
+    await g_context.database.create_task_instance(new_task_instance)
+    bot.scheduler.rearm()
 
     if previous_task:
         await end_task(previous_task)
     return new_task_instance
 
 async def finish_vote(vote: model.TaskVote):
-    channel = g_context.announcement_channel
-    message = channel.get_partial_message(vote.voting_message_id)
-    if message is None:
-        return
-    try:
-        message = await message.fetch()
-    except discord.errors.NotFound:
-        return
-
-    reactions = message.reactions
-    vote_options = g_context.database.get_vote_options(vote.id)
-    reaction_counts = []
-    for reaction in reactions:
-        if str(reaction.emoji) in number_reactions:
-            index = number_reactions.index(str(reaction.emoji))
-            if index < len(vote_options):
-                reaction_counts.append((index, reaction.count))
-    await message.clear_reactions()
-
-    if len(reaction_counts) == 0:
-        return
-
-    reaction_counts.sort(key=lambda pair: pair[1], reverse=True)
-    selected_index: int = reaction_counts[0][0]
+    with logs.log_context(vote_id=vote.id):
+        # The tally is maintained from gateway reaction events, so the vote message doesn't need to be fetched
+        if bot.vote_tally is None or bot.vote_tally.vote_id != vote.id:
+            await bot.restore_vote_tally()
+        tally = bot.vote_tally
+        if tally is None:
+            return
+        selected_index = tally.leader()
+        if selected_index is None:
+            return
+        logging.info(f"Vote {vote.id} closed with counts {tally.counts()}")
 
-    selected_option = vote_options[selected_index]
-    vote.selected_option_id = selected_option.id
-    g_context.database.update_vote(vote)
+        vote_options = await g_context.database.get_vote_options(vote.id)
+        selected_option = vote_options[selected_index]
+        vote.selected_option_id = selected_option.id
+        await g_context.database.update_vote(vote, "selected_option_id")
+        bot.vote_tally = None
+        bot.scheduler.rearm()
 
-    embed = discord.Embed(
-        title="Vote ended",
-        color=0x0099FF,
-        description=f"**Selected task**\n{selected_option.evaluated_task}"
-    )
-    await message.edit(embed=embed)
+        message = g_context.announcement_channel.get_partial_message(int(vote.voting_message_id))
+        embed = discord.Embed(
+            title="Vote ended",
+            color=0x0099FF,
+            description=f"**Selected task**\n{selected_option.evaluated_task}"
+        )
+        try:
+            await message.clear_reactions()
+            await message.edit(embed=embed)
+        except discord.errors.NotFound:
+            pass
 
 async def start_new_vote(end_time_override: datetime.datetime = None):
     database = g_context.database
-    active_vote = database.get_active_vote()
+    active_vote = await database.get_active_vote()
     if active_vote is not None:
         await cancel_vote(active_vote)
-    tasks = database.get_random_tasks(config.voting_task_count)
-    parsed_tasks = [model.ParsedTask.from_task(task) for task in tasks]
+    parsed_tasks = await database.get_random_parsed_tasks(config.voting_task_count)
 
-    start_time = datetime.datetime.now()
+    start_time = bot.clock.now()
     end_time = end_time_override or utils.round_datetime(start_time + datetime.timedelta(seconds=config.voting_time_seconds - config.task_start_delay_seconds))
 
     evaluated_tasks = [task.description.evaluate() for task in parsed_tasks]
@@ -468,6 +675,10 @@ async def start_new_vote(end_time_override: datetime.datetime = None):
     if role is not None:
         content = role.mention
     message = await g_context.announcement_channel.send(content=content, embed=embed)
+    bot.message_cache.add(message, replace=False)
+    # Count reactions from as soon as the message exists, the vote id is filled in once the vote is stored
+    tally = stats.VoteTally(None, message.id, config.voting_task_count)
+    bot.vote_tally = tally
     for i in range(config.voting_task_count):
         await message.add_reaction(number_reactions[i])
 
@@ -480,105 +691,85 @@ async def start_new_vote(end_time_override: datetime.datetime = None):
         voting_message_id=str(message.id),
         selected_option_id=None,
     )
-    database.create_vote(vote_obj)
-
-    for i in range(config.voting_task_count):
-        option = model.TaskVoteOption(
+    options = [
+        model.TaskVoteOption(
             id=None,
-            vote_id=vote_obj.id,
+            vote_id=None,
             option_index=i,
-            task_id=tasks[i].id,
+            task_id=parsed_tasks[i].id,
             evaluated_task=evaluated_tasks[i],
         )
-        database.add_vote_option(option)
-
-    logging.info(f"Starting vote with {config.voting_task_count} options")
-    for i in range(config.voting_task_count):
-        logging.info(f"\t{i + 1}. {evaluated_tasks[i]} (TaskId={tasks[i].id})")
-
-@dataclasses.dataclass
-class TaskStats:
-    tasks: list[model.TaskInstance]
-    completions: list[model.TaskCompletion]
-
-    def has_completions(self):
-        return len(self.completions) > 0
-
-    def get_standard_tasks(self) -> list[model.TaskInstance]:
-        return [t for t in self.tasks if t.task_type == model.TASK_TYPE_STANDARD]
-
-    def get_bonus_tasks(self) -> list[model.TaskInstance]:
-        return [t for t in self.tasks if t.task_type == model.TASK_TYPE_BONUS]
-
-    def get_standard_task_completions(self) -> list[model.TaskCompletion]:
-        standard_task_ids = [t.id for t in self.get_standard_tasks()]
-        return [c for c in self.completions if c.instance_id in standard_task_ids]
-
-    def get_bonus_task_completions(self) -> list[model.TaskCompletion]:
-        bonus_task_ids = [t.id for t in self.get_bonus_tasks()]
-        return [c for c in self.completions if c.instance_id in bonus_task_ids]
-
-    def get_unique_user_ids(self) -> list[int]:
-        user_ids = set([int(c.user_id) for c in self.completions])
-        return list(user_ids)
-
-    def get_completions_for_user(self, user_id: int) -> tuple[list[model.TaskCompletion], list[model.TaskCompletion]]:
-        standard_completions = self.get_standard_task_completions()
-        bonus_completions = self.get_bonus_task_completions()
-        return [c for c in standard_completions if int(c.user_id) == int(user_id)], [c for c in bonus_completions if int(c.user_id) == int(user_id)]
-
-def compute_task_stats(tasks: list[model.TaskInstance]):
-    stats = TaskStats(tasks=tasks, completions=[])
-    for task in tasks:
-        stats.completions += g_context.database.get_task_completions(task.id)
-    return stats
-
-async def draw_winner_with_tasks(tasks: list[model.TaskInstance], existing_message: discord.Message = None, channel: discord.TextChannel = None, update_tasks: bool = True):
-    stats = compute_task_stats(tasks)
+        for i in range(config.voting_task_count)
+    ]
+    await database.create_vote(vote_obj, options)
+    tally.vote_id = vote_obj.id
+    # Ballots counted before the vote was stored, later ones are stored as their events arrive
+    for option_index, voters in enumerate(tally.voters):
+        for user_id in list(voters):
+            if user_id in voters:
+                await bot.write_ballot(model.TaskVoteBallot(vote_id=tally.vote_id, user_id=str(user_id), option_index=option_index), added=True)
+    bot.scheduler.rearm()
+
+    with logs.log_context(vote_id=vote_obj.id):
+        logging.info(f"Starting vote with {config.voting_task_count} options")
+        for i in range(config.voting_task_count):
+            logging.info(f"\t{i + 1}. {evaluated_tasks[i]} (TaskId={parsed_tasks[i].id})")
+
+async def compute_task_stats(tasks: list[model.TaskInstance]):
+    completions = await g_context.database.get_completions_for_task_instances([task.id for task in tasks])
+    return stats.TaskStats(tasks=tasks, completions=completions)
+
+def resolve_users(user_ids: list[int]) -> dict[int, discord.User]:
+    users = {user_id: bot.get_user(user_id) for user_id in user_ids}
+    return {user_id: user for user_id, user in users.items() if user is not None}
+
+DRAW_FOOTER_TASKS_PATTERN = re.compile(r"Tasks (\d+(?:,\d+)*)")
+
+async def draw_winner_with_tasks(tasks: list[model.TaskInstance], existing_message: discord.Message = None, channel: discord.TextChannel = None, update_tasks: bool = True, seed: int = None):
+    task_stats = await compute_task_stats(tasks)
     channel = channel or g_context.announcement_channel
-    if stats.has_completions():
-        winner = random.choice(stats.completions)
-        user = bot.get_user(int(winner.user_id))
-        while user is None and len(stats.completions) > 1:
-            stats.completions.remove(winner)
-            winner = random.choice(stats.completions)
-            user = bot.get_user(int(winner.user_id))
-        if user is not None:
-            role = g_context.announcement_channel.guild.get_role(config.community_role_id)
-            content = ""
-            if role is not None:
-                content = role.mention
-            embed = discord.Embed()
-            embed.color = 0xf9cd46
-            description = f"In the last {len(stats.get_standard_tasks())} weeks, there were...\n\n"
-            description += f"**{len(stats.completions)}** total task completions ({len(stats.get_standard_task_completions())} standard tasks, {len(stats.get_bonus_task_completions())} bonus tasks)\n"
-            description += f"**{len(stats.get_unique_user_ids())}** unique participants\n\n"
-            description += f"**The winner is, {user.mention if user is not None else 'Unknown'}!**\n\n"
-            description += "Please message a task admin to claim your prize."
-            embed.description = description
-            if existing_message is not None:
-                await existing_message.edit(embed=embed, content=content)
-            else:
-                await channel.send(embed=embed, content=content)
+    draw = stats.draw_winner(
+        task_stats,
+        resolve_users,
+        weighting=config.winner_weighting,
+        bonus_multiplier=config.winner_bonus_multiplier,
+        seed=seed,
+    )
+    logging.info(f"Drew winner {draw.winner_user_id} from {draw.entry_count} entries (Seed={draw.seed})")
+    content = ""
+    if draw.winner is not None:
+        role = g_context.announcement_channel.guild.get_role(config.community_role_id)
+        if role is not None:
+            content = role.mention
+        embed = discord.Embed()
+        embed.color = 0xf9cd46
+        description = f"In the last {len(task_stats.get_standard_tasks())} weeks, there were...\n\n"
+        description += f"**{len(task_stats.completions)}** total task completions ({len(task_stats.get_standard_task_completions())} standard tasks, {len(task_stats.get_bonus_task_completions())} bonus tasks)\n"
+        description += f"**{len(task_stats.get_unique_user_ids())}** unique participants\n\n"
+        description += f"**The winner is, {draw.winner.mention}!**\n\n"
+        description += "Please message a task admin to claim your prize."
+        embed.description = description
     else:
         embed = discord.Embed(title="Congratuations!")
         embed.description = f"No winners"
-        if existing_message is not None:
-            await existing_message.edit(embed=embed, content=content)
-        else:
-            await channel.send(embed=embed, content=content)
+    # The seed and the task instances the entries came from, !rerollwinner with the same seed draws the same winner
+    embed.set_footer(text=f"Draw seed {draw.seed} | Tasks {','.join(str(task.id) for task in tasks)}")
+    if existing_message is not None:
+        await existing_message.edit(embed=embed, content=content)
+    else:
+        await channel.send(embed=embed, content=content)
     if update_tasks:
         for task in tasks:
             task.drawn_prize = True
-            g_context.database.update_task_instance(task)
+            await g_context.database.update_task_instance(task, "drawn_prize")
 
 async def draw_winner(channel: discord.TextChannel = None, update_tasks: bool = True):
-    unclaimed_tasks = g_context.database.get_unclaimed_tasks()
+    unclaimed_tasks = await g_context.database.get_unclaimed_tasks()
     await draw_winner_with_tasks(unclaimed_tasks, existing_message=None, channel=channel, update_tasks=update_tasks)
 
 # Setup bot commands
 
-@bot.command()
+@bot_command()
 async def bonustask(ctx: commands.Context, task_description: str, task_instruction: str):
     if not is_bingo_admin(ctx.author):
         return
@@ -588,23 +779,23 @@ async def bonustask(ctx: commands.Context, task_description: str, task_instructi
     else:
         logging.error(f"Failed to create bonus task")
 
-@bot.command()
+@bot_command()
 async def listtasks(ctx: commands.Context, page: int = 1):
     if not is_bingo_admin(ctx.author):
         return
-    tasks = g_context.database.get_standard_tasks()
+    tasks = await g_context.database.get_standard_tasks()
     formatted_tasks = [f"**{task.id}** {task.description}" for task in tasks]
     paginator = utils.Paginator(bot, formatted_tasks, per_page=25, start_page=page)
     await paginator.send(ctx)
 
-@bot.command()
+@bot_command()
 async def gettask(ctx: commands.Context, task_id: int = None):
     if not is_bingo_admin(ctx.author):
         return
     if task_id is None:
-        task = g_context.database.get_random_task()
+        task = await g_context.database.get_random_task()
     else:
-        task = g_context.database.get_task_by_id(task_id)
+        task = await g_context.database.get_task_by_id(task_id)
         if task is None:
             raise Exception(f"No task with ID {task_id}")
     parsed_task = model.ParsedTask.from_task(task)
@@ -616,53 +807,76 @@ async def gettask(ctx: commands.Context, task_id: int = None):
     # embed.set_author(name=ctx.author.display_name, icon_url=ctx.author.avatar.url)
     await ctx.send(embed=embed)
 
-@bot.command()
+@bot_command()
 async def edit(ctx: commands.Context, task_id: int, template: str):
     if not is_bingo_admin(ctx.author):
         return
     template_obj = templates.ParsedTemplate(template)
-    existing_task = g_context.database.get_task_by_id(task_id)
+    existing_task = await g_context.database.get_task_by_id(task_id)
     if not existing_task:
         raise Exception(f"No task with ID {task_id}")
     existing_task.description = template_obj.get_template()
-    g_context.database.update_task(existing_task)
+    await g_context.database.update_task(existing_task)
     await ctx.send(f"Successfully updated task **{task_id}**: {existing_task.description}")
 
-@bot.command()
+@bot_command()
+async def setweight(ctx: commands.Context, task_id: int, weight: int):
+    if not is_bingo_admin(ctx.author):
+        return
+    existing_task = await g_context.database.get_task_by_id(task_id)
+    if not existing_task:
+        raise Exception(f"No task with ID {task_id}")
+    existing_task.weight = max(weight, 0)
+    await g_context.database.update_task(existing_task)
+    await ctx.send(f"Successfully updated task **{task_id}** weight to {existing_task.weight}")
+
+@bot_command()
 async def startvote(ctx: commands.Context, end_time: int = None):
     if not is_bingo_admin(ctx.author):
         return
     await start_new_vote(end_time_override=datetime.datetime.fromtimestamp(end_time) if end_time is not None else None)
 
-@bot.command()
+@bot_command()
+async def votestatus(ctx: commands.Context):
+    if not is_bingo_admin(ctx.author):
+        return
+    tally = bot.vote_tally
+    if tally is None:
+        await ctx.send("No active vote")
+        return
+    counts = tally.counts()
+    lines = [f"{number_reactions[index]} {count} votes" for index, count in enumerate(counts)]
+    await ctx.send(f"Current leader: {number_reactions[tally.leader()]}\n" + "\n".join(lines))
+
+@bot_command()
 async def drawwinner(ctx: commands.Context):
     if not is_bingo_admin(ctx.author):
         return
     await draw_winner()
 
-@bot.command()
+@bot_command()
 async def testwinner(ctx: commands.Context):
     if not is_bingo_admin(ctx.author):
         return
     await draw_winner(channel=ctx.channel, update_tasks=False)
 
-@bot.command()
+@bot_command()
 async def activetask(ctx: commands.Context):
     if not is_bingo_admin(ctx.author):
         return
-    task_instance = g_context.database.get_active_task_instance()
+    task_instance = await g_context.database.get_active_task_instance()
     if task_instance is not None:
         await ctx.send(f"Active task: {task_instance.evaluated_task}")
     else:
         await ctx.send("No active task")
 
-@bot.command()
+@bot_command()
 async def completions(ctx: commands.Context):
     if not is_bingo_admin(ctx.author):
         return
-    active_task = g_context.database.get_active_task_instance()
+    active_task = await g_context.database.get_active_task_instance()
     if active_task is not None:
-        completions = g_context.database.get_task_completions(active_task.id)
+        completions = await g_context.database.get_task_completions(active_task.id)
         completion_strs = []
         for completion in completions:
             user = bot.get_user(int(completion.user_id))
@@ -678,33 +892,26 @@ async def completions(ctx: commands.Context):
     else:
         await ctx.send("No active task")
 
-@bot.command()
+@bot_command()
 async def reloadtasks(ctx: commands.Context):
     if not is_bingo_admin(ctx.author):
         return
-    g_context.database.delete_all_tasks()
-    with open(config.tasks_filename, "r") as f:
-        tasks = f.readlines()
-    parsed_tasks = []
-    for index, task in enumerate(tasks):
-        parts = task.split(";")
-        if len(parts) == 2:
-            parsed_tasks.append(
-                model.Task(
-                    id=index + 1,
-                    description=parts[0],
-                    weight=1,
-                    instruction=parts[1],
-                )
-            )
-    g_context.database.insert_tasks(parsed_tasks)
-
-@bot.command()
-async def rerollwinner(ctx: commands.Context, message_id: str):
+    # File reads and hashing, kept off the loop and out of the database executor
+    task_list = await asyncio.to_thread(tasklist.load_tasks, config.tasks_filename, config.tasks_cache_filename)
+    result = await g_context.database.sync_tasks(task_list.tasks, task_list.parsed_templates)
+    message = f"Reloaded tasks: {result.inserted} added, {result.updated} updated, {result.retired} retired"
+    if task_list.errors:
+        message += f"\nSkipped {len(task_list.errors)} invalid lines:\n" + "\n".join(f"Line {error.line_number}: {error.message}" for error in task_list.errors[:10])
+    await ctx.send(message[:2000])
+
+@bot_command()
+async def rerollwinner(ctx: commands.Context, message_id: str, seed: int = None):
+    if not is_bingo_admin(ctx.author):
+        return
     channel = g_context.announcement_channel
     message = channel.get_partial_message(int(message_id))
     if not message:
-        ctx.send("No message found")
+        await ctx.send("No message found")
         return
     try:
         message = await message.fetch()
@@ -712,27 +919,57 @@ async def rerollwinner(ctx: commands.Context, message_id: str):
         pattern = "In the last (\d+) weeks, there were..."
         matches = re.match(pattern, message_content)
         if not matches:
-            ctx.send("Invalid message format")
+            await ctx.send("Invalid message format")
             return
-        weeks = int(matches.group(1))
-        logging.info(f"Weeks {weeks}")
-        timestamp = message.created_at - datetime.timedelta(seconds=weeks * config.task_duration_seconds)
-        task_instances = g_context.database.get_completed_tasks_between(timestamp, message.created_at)
-        await draw_winner_with_tasks(task_instances, existing_message=message, update_tasks=False)
+        footer_matches = DRAW_FOOTER_TASKS_PATTERN.search(message.embeds[0].footer.text or "")
+        if footer_matches:
+            task_instances = await g_context.database.get_task_instances_by_ids([int(task_id) for task_id in footer_matches.group(1).split(",")])
+        else:
+            # Announcements from before the footer listed the tasks, the entries are rebuilt from the time window instead
+            weeks = int(matches.group(1))
+            logging.info(f"Weeks {weeks}")
+            timestamp = message.created_at - datetime.timedelta(seconds=weeks * config.task_duration_seconds)
+            task_instances = await g_context.database.get_completed_tasks_between(timestamp, message.created_at)
+        await draw_winner_with_tasks(task_instances, existing_message=message, update_tasks=False, seed=seed)
     except discord.errors.NotFound:
-        ctx.send("No message found")
+        await ctx.send("No message found")
         return
 
-@bot.command()
+@bot_command()
 async def taskcount(ctx: commands.Context):
     if not is_bingo_admin(ctx.author):
         return
-    completed_tasks = g_context.database.get_unclaimed_tasks()
-    standard_tasks = [t for t in completed_tasks if t.task_type == model.TASK_TYPE_STANDARD]
-    bonus_tasks = [t for t in completed_tasks if t.task_type == model.TASK_TYPE_BONUS]
-    await ctx.send(f"{len(standard_tasks)} standard, {len(bonus_tasks)} bonus")
+    completed_tasks = await g_context.database.get_unclaimed_tasks()
+    task_stats = await compute_task_stats(completed_tasks)
+    await ctx.send(f"{len(task_stats.get_standard_tasks())} standard, {len(task_stats.get_bonus_tasks())} bonus ({len(task_stats.completions)} completions)")
 
-@bot.command()
+MAX_PROFILE_SECONDS = 120
+
+@bot_command()
+async def profile(ctx: commands.Context, seconds: float = 10):
+    if not is_bingo_admin(ctx.author):
+        return
+    if bot.profiling:
+        await ctx.send("A profile is already running")
+        return
+    seconds = min(max(seconds, 1), MAX_PROFILE_SECONDS)
+    bot.profiling = True
+    try:
+        await ctx.send(f"Profiling for {seconds:g} seconds")
+        # Sampling runs on a worker thread so the loop being profiled keeps running normally
+        report = await asyncio.to_thread(profiling.SamplingProfiler().run, seconds)
+        filename = os.path.join(config.profile_directory, f"profile-{bot.clock.now():%Y%m%d-%H%M%S}.folded")
+        await asyncio.to_thread(report.write, filename)
+    finally:
+        bot.profiling = False
+    logging.info(f"Saved profile {filename} ({report.sample_count} samples)")
+
+    total = sum(report.stacks.values())
+    top_frames = "\n".join(f"`{count * 100 / total:5.1f}%` {frame}" for frame, count in report.self_samples().most_common(10))
+    content = f"{report.sample_count} samples over {report.duration_seconds:.1f}s, saved to {filename} (collapsed stacks for flamegraph.pl or speedscope)\n**Top frames by self samples:**\n{top_frames}"
+    await ctx.send(content[:utils.DISCORD_MESSAGE_LIMIT], file=discord.File(filename))
+
+@bot_command()
 async def testpermissions(ctx: commands.Context):
     if not is_bingo_admin(ctx.author):
         return
@@ -750,7 +987,50 @@ def handle_errors(*cmds):
             logging.error(traceback.format_exc())
             # await ctx.send(f"Failed to run command!\n{str(traceback.format_exc())}")
 
-handle_errors(*bot.all_commands.values())
-
-# Run bot
-bot.run(bot_token)
+def setup(bot_config: BotConfig, database: model.AsyncDatabaseConnection, clock: utils.Clock = None, bot_class: type[BingoBot] = BingoBot) -> BingoBot:
+    # bot_class and clock let the simulator run the same handlers against a fake gateway in virtual time
+    global config, bot, g_context
+    config = bot_config
+    bot = bot_class(
+        intents=discord.Intents.all(),
+        command_prefix=COMMAND_PREFIX,
+        description=description,
+        case_insensitive=True,
+        clock=clock,
+        http_trace=metrics.discord_trace_config(),
+    )
+    for command in bot_commands:
+        bot.add_command(command)
+    handle_errors(*bot.all_commands.values())
+    g_context = BotContext(
+        database=database,
+        announcement_channel=None,
+        submission_channel=None,
+    )
+    metrics.DISCORD_GATEWAY_LATENCY.set_function(lambda: bot.latency)
+    metrics.APPROVAL_QUEUE_DEPTH.set_function(lambda: sum(queue.qsize() for queue in bot.approval_pool.queues))
+    metrics.LOG_CHANNEL_QUEUE_DEPTH.set_function(lambda: bot.logger.queue.qsize() if bot.logger is not None else 0)
+    metrics.MESSAGE_CACHE_SIZE.set_function(lambda: len(bot.message_cache.messages))
+    return bot
+
+def main():
+    bot_config = get_config_from_args()
+    database_connection = model.DatabaseConnection(
+        bot_config.database_dsn,
+        min_connections=bot_config.database_min_connections,
+        max_connections=bot_config.database_max_connections,
+    )
+    database_connection.initialize()
+    task_list = tasklist.load_tasks(bot_config.tasks_filename, bot_config.tasks_cache_filename)
+    for error in task_list.errors:
+        logging.warning(f"Skipping invalid task: {error}")
+    database_connection.sync_tasks(task_list.tasks, task_list.parsed_templates)
+    database_connection.get_catalog()
+
+    setup(bot_config, model.AsyncDatabaseConnection(database_connection))
+    # Run bot
+    # log_handler=None leaves discord.py's records to the root queue handler instead of its own stderr handler
+    bot.run(read_discord_token(bot_config), log_handler=None)
+
+if __name__ == "__main__":
+    main()
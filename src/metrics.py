@@ -0,0 +1,229 @@
+import bisect
+import contextlib
+import logging
+import re
+import threading
+import time
+from typing import Awaitable, Callable, Union
+
+import aiohttp
+from aiohttp import web
+
+# Minimal Prometheus instrumentation. Metrics are module level so any module can record without passing a registry around,
+# observations are thread safe since database calls are timed on the executor threads.
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace("\"", "\\\"")
+
+def _format_labels(labels: dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Metric:
+    type_name = ""
+
+    def __init__(self, name: str, help: str, label_names: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.label_names = label_names
+        self.lock = threading.Lock()
+
+    def _labels(self, label_values: tuple) -> dict[str, str]:
+        if len(label_values) != len(self.label_names):
+            raise ValueError(f"{self.name} expects labels {self.label_names}, got {label_values}")
+        return dict(zip(self.label_names, label_values))
+
+    def samples(self) -> list[tuple[str, dict[str, str], float]]:
+        raise NotImplementedError()
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type_name}"]
+        for name, labels, value in self.samples():
+            lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return lines
+
+class Counter(Metric):
+    type_name = "counter"
+
+    def __init__(self, name: str, help: str, label_names: tuple[str, ...] = ()):
+        super().__init__(name, help, label_names)
+        self.values: dict[tuple, float] = {}
+
+    def inc(self, *label_values, amount: float = 1):
+        with self.lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def samples(self):
+        with self.lock:
+            values = list(self.values.items())
+        return [(self.name, self._labels(label_values), value) for label_values, value in values]
+
+class Gauge(Metric):
+    type_name = "gauge"
+
+    def __init__(self, name: str, help: str):
+        super().__init__(name, help)
+        self.value = 0
+        self.function: Union[Callable[[], float], None] = None
+
+    def set(self, value: float):
+        self.value = value
+
+    def set_function(self, function: Callable[[], float]):
+        # Evaluated at scrape time, for values that are cheaper to read than to keep updated
+        self.function = function
+
+    def samples(self):
+        if self.function is not None:
+            try:
+                return [(self.name, {}, self.function())]
+            except Exception:
+                logging.exception(f"Failed to read gauge {self.name}")
+                return []
+        return [(self.name, {}, self.value)]
+
+class Histogram(Metric):
+    type_name = "histogram"
+
+    def __init__(self, name: str, help: str, label_names: tuple[str, ...] = (), buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, help, label_names)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [per bucket counts (last is +Inf), sum]
+        self.values: dict[tuple, list] = {}
+
+    def observe(self, value: float, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            entry = self.values.get(label_values)
+            if entry is None:
+                entry = self.values[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    @contextlib.contextmanager
+    def time(self, *label_values):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *label_values)
+
+    def samples(self):
+        with self.lock:
+            values = [(label_values, list(counts), total) for label_values, (counts, total) in self.values.items()]
+        samples = []
+        for label_values, counts, total in values:
+            labels = self._labels(label_values)
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                samples.append((f"{self.name}_bucket", {**labels, "le": _format_value(float(bound))}, cumulative))
+            samples.append((f"{self.name}_sum", labels, total))
+            samples.append((f"{self.name}_count", labels, cumulative))
+        return samples
+
+class Registry:
+    def __init__(self):
+        self.metrics: list[Metric] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines += metric.render()
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+
+DB_QUERY_SECONDS: Histogram = REGISTRY.register(Histogram("bingo_db_query_seconds", "Time spent running a database call on an executor thread", ("method",)))
+DB_WAIT_SECONDS: Histogram = REGISTRY.register(Histogram("bingo_db_wait_seconds", "Time a database call waited for a free executor thread", ("method",)))
+DB_ERRORS: Counter = REGISTRY.register(Counter("bingo_db_errors_total", "Database calls that raised", ("method",)))
+DISCORD_REQUEST_SECONDS: Histogram = REGISTRY.register(Histogram("bingo_discord_request_seconds", "Discord REST request latency", ("method", "route")))
+DISCORD_REQUESTS: Counter = REGISTRY.register(Counter("bingo_discord_requests_total", "Discord REST requests by response status", ("method", "route", "status")))
+DISCORD_RATE_LIMITS: Counter = REGISTRY.register(Counter("bingo_discord_rate_limits_total", "Discord REST requests answered with 429", ("method", "route")))
+DISCORD_GATEWAY_LATENCY: Gauge = REGISTRY.register(Gauge("bingo_discord_gateway_latency_seconds", "Gateway heartbeat latency"))
+SCHEDULER_COMPUTE_SECONDS: Histogram = REGISTRY.register(Histogram("bingo_scheduler_compute_seconds", "Time to derive the scheduled jobs from the database"))
+SCHEDULER_JOB_SECONDS: Histogram = REGISTRY.register(Histogram("bingo_scheduler_job_seconds", "Scheduled job run time", ("job",)))
+SCHEDULER_JOB_FAILURES: Counter = REGISTRY.register(Counter("bingo_scheduler_job_failures_total", "Scheduled jobs that raised", ("job",)))
+APPROVAL_LATENCY_SECONDS: Histogram = REGISTRY.register(Histogram("bingo_approval_latency_seconds", "Time from an approval reaction event to it being fully processed", ("action",)))
+APPROVAL_QUEUE_DEPTH: Gauge = REGISTRY.register(Gauge("bingo_approval_queue_depth", "Approval events waiting for a worker"))
+LOG_CHANNEL_QUEUE_DEPTH: Gauge = REGISTRY.register(Gauge("bingo_log_channel_queue_depth", "Lines waiting to be posted to the log channel"))
+LOG_CHANNEL_DROPPED: Counter = REGISTRY.register(Counter("bingo_log_channel_dropped_total", "Log channel lines dropped because the queue was full or Discord kept rate limiting"))
+MESSAGE_CACHE_SIZE: Gauge = REGISTRY.register(Gauge("bingo_message_cache_size", "Messages held in the message cache"))
+EVENT_LOOP_LAG_SECONDS: Histogram = REGISTRY.register(Histogram("bingo_event_loop_lag_seconds", "How late the event loop woke a sleeping task"))
+LOG_RECORDS_DROPPED: Counter = REGISTRY.register(Counter("bingo_log_records_dropped_total", "Log records dropped because the log writer queue was full"))
+SLOW_CALLBACKS: Counter = REGISTRY.register(Counter("bingo_slow_callbacks_total", "Times the event loop was blocked for longer than the slow callback threshold"))
+
+ROUTE_PATTERNS = [
+    (re.compile(r"^/api/v\d+"), ""),
+    (re.compile(r"/reactions/[^/]+"), "/reactions/{emoji}"),
+    (re.compile(r"/(webhooks|interactions)/(\d+)/[^/]+"), r"/\1/{id}/{token}"),
+    (re.compile(r"/\d{15,}"), "/{id}"),
+]
+
+def route_template(path: str) -> str:
+    # Ids, tokens and emoji are replaced so routes have bounded cardinality
+    for pattern, replacement in ROUTE_PATTERNS:
+        path = pattern.sub(replacement, path)
+    return path or "/"
+
+def discord_trace_config() -> aiohttp.TraceConfig:
+    # Passed to the bot as http_trace, so every REST request discord.py makes (including its own retries) is recorded
+    trace_config = aiohttp.TraceConfig()
+
+    async def on_request_start(session, context, params: aiohttp.TraceRequestStartParams):
+        context.start = time.perf_counter()
+
+    async def on_request_end(session, context, params: aiohttp.TraceRequestEndParams):
+        route = route_template(params.url.path)
+        DISCORD_REQUEST_SECONDS.observe(time.perf_counter() - context.start, params.method, route)
+        DISCORD_REQUESTS.inc(params.method, route, str(params.response.status))
+        if params.response.status == 429:
+            DISCORD_RATE_LIMITS.inc(params.method, route)
+
+    async def on_request_exception(session, context, params: aiohttp.TraceRequestExceptionParams):
+        route = route_template(params.url.path)
+        DISCORD_REQUEST_SECONDS.observe(time.perf_counter() - context.start, params.method, route)
+        DISCORD_REQUESTS.inc(params.method, route, "error")
+
+    trace_config.on_request_start.append(on_request_start)
+    trace_config.on_request_end.append(on_request_end)
+    trace_config.on_request_exception.append(on_request_exception)
+    return trace_config
+
+async def start_server(host: str, port: int, readiness_check: Callable[[], Awaitable[tuple[bool, str]]]) -> web.AppRunner:
+    # /metrics in Prometheus text format, /healthz answers as long as the event loop does, /readyz runs readiness_check
+    async def handle_metrics(request: web.Request) -> web.Response:
+        return web.Response(body=REGISTRY.render().encode("utf-8"), headers={"Content-Type": PROMETHEUS_CONTENT_TYPE})
+
+    async def handle_health(request: web.Request) -> web.Response:
+        return web.Response(text="ok")
+
+    async def handle_ready(request: web.Request) -> web.Response:
+        try:
+            ready, reason = await readiness_check()
+        except Exception as e:
+            ready, reason = False, str(e)
+        return web.Response(text=reason, status=200 if ready else 503)
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle_metrics)
+    app.router.add_get("/healthz", handle_health)
+    app.router.add_get("/readyz", handle_ready)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logging.info(f"Serving metrics on {host}:{port}")
+    return runner
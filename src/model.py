@@ -1,10 +1,20 @@
+import asyncio
+import collections
+import concurrent.futures
 import dataclasses
 import datetime
+import functools
+import hashlib
+import contextlib
 import logging
-import random
+import threading
+import time
 import psycopg2
 import psycopg2.errors
+import psycopg2.extensions
+import psycopg2.extras
 from typing import Type, Generic, TypeVar, Union
+import metrics
 import templates
 import utils
 
@@ -16,6 +26,21 @@ class Task:
     description: str
     instruction: str
     weight: int
+    # Set by sync_tasks when the task is no longer in the task list, independent of the weight an admin sets
+    retired: bool = False
+
+def task_text_hash(task: Task) -> str:
+    # Identifies a task list line regardless of where it is in the file
+    return hashlib.sha1(f"{task.description}\0{task.instruction}".encode("utf-8")).hexdigest()
+
+def task_content_hash(task: Task) -> str:
+    return hashlib.sha1(f"{task.description}\0{task.instruction}\0{task.weight}\0{task.retired}".encode("utf-8")).hexdigest()
+
+@dataclasses.dataclass
+class TaskSyncResult:
+    inserted: int = 0
+    updated: int = 0
+    retired: int = 0
 
 @dataclasses.dataclass
 class ParsedTask:
@@ -33,14 +58,32 @@ class ParsedTask:
         )
 
     @classmethod
-    def from_task(self, task: Task):
+    def from_task(self, task: Task, description: templates.ParsedTemplate = None):
         return ParsedTask(
             id=task.id,
-            description=templates.ParsedTemplate(task.description),
+            description=description or templates.ParsedTemplate(task.description),
             instruction=task.instruction,
             weight=task.weight,
         )
     
+class TaskCatalog:
+    def __init__(self, tasks: list[Task], parsed_templates: dict[str, templates.ParsedTemplate] = None):
+        self.tasks = tasks
+        self.tasks_by_id = {task.id: task for task in tasks}
+        self.standard_tasks = [task for task in tasks if task.weight > 0 and not task.retired]
+        # Only standard tasks are drawn into votes, bonus task templates are evaluated once on creation.
+        # parsed_templates (description -> template) are reused instead of parsing the descriptions again.
+        parsed_templates = parsed_templates or {}
+        self.parsed_standard_tasks = [ParsedTask.from_task(task, parsed_templates.get(task.description)) for task in self.standard_tasks]
+        self.sampler = utils.WeightedSampler([task.weight for task in self.standard_tasks])
+
+    def sample_indices(self, ntasks: int) -> list[int]:
+        return self.sampler.sample(ntasks)
+
+DEFAULT_TASK_WEIGHT = 1
+# Task list ids are line numbers, bonus tasks are allocated ids from here upwards
+BONUS_TASK_MIN_ID = 100000
+
 TASK_TYPE_STANDARD = "Standard"
 TASK_TYPE_BONUS = "Bonus"
 
@@ -84,16 +127,70 @@ class TaskVoteOption:
     task_id: int
     evaluated_task: str
 
+@dataclasses.dataclass
+class TaskVoteBallot:
+    vote_id: int
+    user_id: str
+    option_index: int
+
 TASKS_TABLE = "tasks"
 TASK_INSTANCES_TABLE = "task_instances"
 TASK_COMPLETIONS_TABLE = "task_completions"
 
 TASK_VOTING_TABLE = "task_votes"
 TASK_VOTING_OPTION_TABLE = "task_vote_options"
+TASK_VOTING_BALLOT_TABLE = "task_vote_ballots"
+
+class PreparingConnection(psycopg2.extensions.connection):
+    # Remembers which server-side prepared statements exist in this session
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared_statements: set[str] = set()
+
+@dataclasses.dataclass(frozen=True)
+class CompiledStatement:
+    name: str
+    prepare_query: str
+    execute_query: str
+
+@functools.lru_cache(maxsize=None)
+def compile_statement(query: str) -> CompiledStatement:
+    # Rewrite psycopg2 %s placeholders to $n so the query can be PREPAREd once per connection and EXECUTEd after that
+    parts = query.split("%s")
+    name = "bingo_" + hashlib.sha1(query.encode("utf-8")).hexdigest()[:16]
+    prepared_query = parts[0] + "".join(f"${index + 1}{part}" for index, part in enumerate(parts[1:]))
+    execute_query = f"EXECUTE {name}"
+    if len(parts) > 1:
+        execute_query += f" ({', '.join('%s' for _ in parts[1:])})"
+    return CompiledStatement(name=name, prepare_query=f"PREPARE {name} AS {prepared_query}", execute_query=execute_query)
+
+def execute_query(cursor: "psycopg2.cursor", query: str, vars):
+    prepared_statements = getattr(cursor.connection, "prepared_statements", None)
+    if prepared_statements is None:
+        cursor.execute(query, vars)
+        return
+    statement = compile_statement(query)
+    if statement.name not in prepared_statements:
+        cursor.execute(statement.prepare_query)
+        prepared_statements.add(statement.name)
+    cursor.execute(statement.execute_query, vars)
+
+@functools.lru_cache(maxsize=None)
+def compile_insert(model_type: type, table_name: str, included_fields: tuple[str, ...], return_col_name: Union[str, None]) -> str:
+    returning = f" RETURNING {return_col_name}" if return_col_name is not None else ""
+    return f"INSERT INTO \"{table_name}\" ({', '.join(included_fields)}) VALUES ({', '.join('%s' for _ in included_fields)}){returning}"
+
+@functools.lru_cache(maxsize=None)
+def compile_update(model_type: type, table_name: str, fields: tuple[str, ...]) -> str:
+    return f"UPDATE {table_name} SET {', '.join(f'{field}=%s' for field in fields)} WHERE id = %s"
+
+@functools.lru_cache(maxsize=None)
+def model_fields(model_type: type) -> tuple[str, ...]:
+    return tuple(model_type.__dataclass_fields__.keys())
 
 def select_with_model(model: Type[T], connection: "psycopg2.connection", query: str, *vars) -> Union[T, None]:
     cursor = connection.cursor()
-    cursor.execute(query, vars)
+    execute_query(cursor, query, vars)
     row = cursor.fetchone()
     cursor.close()
     if row is not None:
@@ -102,225 +199,679 @@ def select_with_model(model: Type[T], connection: "psycopg2.connection", query:
 
 def select_multiple_with_model(model: Type[T], connection: "psycopg2.connection", query: str, *vars) -> list[T]:
     cursor = connection.cursor()
-    cursor.execute(query, vars)
+    execute_query(cursor, query, vars)
     rows = cursor.fetchall()
     cursor.close()
     return [model(*row) for row in rows]
 
-def insert_model(model: T, connection: "psycopg2.connection", table_name: str, return_col_name: str = None):
+def insert_model(model: T, connection: "psycopg2.connection", table_name: str, return_col_name: str = None, commit: bool = True):
     cursor = connection.cursor()
-    fields = model.__dataclass_fields__.keys()
-    included_fields = [field for field in fields if field != "id" or getattr(model, field) is not None]
+    fields = model_fields(type(model))
+    included_fields = tuple(field for field in fields if field != "id" or model.id is not None)
     values = [getattr(model, field) for field in included_fields]
     try:
-        columns_str = ', '.join(included_fields)
-        returning = f" RETURNING {return_col_name}" if return_col_name is not None else ""
-        cursor.execute(f"INSERT INTO \"{table_name}\" ({columns_str}) VALUES ({', '.join('%s' for _ in values)}){returning}", values)
+        execute_query(cursor, compile_insert(type(model), table_name, included_fields, return_col_name), values)
         result = None
         if return_col_name is not None:
             result = cursor.fetchone()[0]
         cursor.close()
-        connection.commit()
+        if commit:
+            connection.commit()
         return result
     except psycopg2.errors.Error as e:
-        connection.commit()
+        # Inside a transaction the caller rolls back instead
+        if commit:
+            connection.commit()
         raise e
 
-def update_model(model: T, connection: "psycopg2.connection", table_name: str):
+def update_model(model: T, connection: "psycopg2.connection", table_name: str, fields: tuple[str, ...] = None, commit: bool = True):
+    # fields limits the update to the columns that changed, all columns are written by default
+    fields = tuple(fields) if fields else model_fields(type(model))
     cursor = connection.cursor()
-    parameters = []
-    for field in model.__dataclass_fields__.keys():
-        parameters.append(field)
-        parameters.append(getattr(model, field))
-    parameters_arr = [f"{parameters[i * 2]}=%s" for i in range(len(parameters) // 2)]
-    cursor.execute(f"UPDATE {table_name} SET {', '.join(parameters_arr)} WHERE id = %s", [*[param for idx, param in enumerate(parameters) if idx % 2 == 1], model.id])
+    execute_query(cursor, compile_update(type(model), table_name, fields), [*[getattr(model, field) for field in fields], model.id])
     cursor.close()
-    connection.commit()
+    if commit:
+        connection.commit()
+
+def insert_models(models: list[T], connection: "psycopg2.connection", table_name: str, return_col_name: str = None, commit: bool = True) -> list:
+    # Multi-row INSERT in one round trip, returns return_col_name of each row in the order of models
+    fields = model_fields(type(models[0]))
+    included_fields = tuple(field for field in fields if field != "id" or models[0].id is not None)
+    returning = f" RETURNING {return_col_name}" if return_col_name is not None else ""
+    cursor = connection.cursor()
+    try:
+        rows = psycopg2.extras.execute_values(
+            cursor,
+            f"INSERT INTO \"{table_name}\" ({', '.join(included_fields)}) VALUES %s{returning}",
+            [[getattr(model, field) for field in included_fields] for model in models],
+            page_size=len(models),
+            fetch=return_col_name is not None,
+        )
+        cursor.close()
+        if commit:
+            connection.commit()
+        return [row[0] for row in rows] if return_col_name is not None else []
+    except psycopg2.errors.Error as e:
+        if commit:
+            connection.rollback()
+        raise e
+
+def upsert_models(models: list[T], connection: "psycopg2.connection", table_name: str, conflict_col_name: str = "id", commit: bool = True):
+    # Single multi-row INSERT ... ON CONFLICT DO UPDATE in one transaction
+    fields = model_fields(type(models[0]))
+    updates = ', '.join(f"{field}=EXCLUDED.{field}" for field in fields if field != conflict_col_name)
+    cursor = connection.cursor()
+    try:
+        psycopg2.extras.execute_values(
+            cursor,
+            f"INSERT INTO \"{table_name}\" ({', '.join(fields)}) VALUES %s ON CONFLICT ({conflict_col_name}) DO UPDATE SET {updates}",
+            [[getattr(model, field) for field in fields] for model in models],
+            page_size=len(models),
+        )
+        cursor.close()
+        if commit:
+            connection.commit()
+    except psycopg2.errors.Error as e:
+        # Inside a transaction the caller rolls back instead
+        if commit:
+            connection.rollback()
+        raise e
+
+SCHEMA_MIGRATIONS_TABLE = "schema_migrations"
+# Arbitrary key for pg_advisory_lock so two bot processes don't migrate at the same time
+SCHEMA_MIGRATIONS_LOCK_ID = 7304
+
+def _migrate_create_tables(cursor: "psycopg2.cursor"):
+    cursor.execute(f"""
+        --DROP TABLE IF EXISTS {TASKS_TABLE} CASCADE;
+        CREATE TABLE IF NOT EXISTS {TASKS_TABLE} (
+            id INTEGER PRIMARY KEY,
+            description VARCHAR(255) NOT NULL,
+            instruction VARCHAR(255) NOT NULL,
+            weight INTEGER NOT NULL
+        )
+    """)
+    cursor.execute(f"""
+        --DROP TABLE IF EXISTS {TASK_INSTANCES_TABLE} CASCADE;
+        CREATE TABLE IF NOT EXISTS {TASK_INSTANCES_TABLE} (
+            id SERIAL PRIMARY KEY,
+            task_id INTEGER,
+            task_type VARCHAR(64) NOT NULL,
+            evaluated_task VARCHAR(255) NOT NULL,
+            start_time TIMESTAMP NOT NULL,
+            end_time TIMESTAMP,
+            channel_id VARCHAR(128),
+            message_id VARCHAR(128),
+            drawn_prize BOOLEAN,
+            FOREIGN KEY (task_id) REFERENCES {TASKS_TABLE}(id) ON DELETE SET NULL
+        )
+    """)
+    cursor.execute(f"""
+        --DROP TABLE IF EXISTS {TASK_COMPLETIONS_TABLE} CASCADE;
+        CREATE TABLE IF NOT EXISTS {TASK_COMPLETIONS_TABLE} (
+            id SERIAL PRIMARY KEY,
+            instance_id INTEGER NOT NULL,
+            user_id VARCHAR(128),
+            approver_id VARCHAR(128),
+            completion_time TIMESTAMP,
+            evidence_channel_id VARCHAR(128),
+            evidence_message_id VARCHAR(128),
+            FOREIGN KEY (instance_id) REFERENCES {TASK_INSTANCES_TABLE}(id) ON DELETE CASCADE,
+            UNIQUE (instance_id, user_id)
+        )
+    """)
+    cursor.execute(f"""
+        --DROP TABLE IF EXISTS {TASK_VOTING_TABLE} CASCADE;
+        CREATE TABLE IF NOT EXISTS {TASK_VOTING_TABLE} (
+            id SERIAL PRIMARY KEY,
+            start_time TIMESTAMP,
+            end_time TIMESTAMP,
+            completed BOOLEAN,
+            voting_channel_id VARCHAR(128),
+            voting_message_id VARCHAR(128)
+        )
+    """)
+    cursor.execute(f"""
+        --DROP TABLE IF EXISTS {TASK_VOTING_OPTION_TABLE} CASCADE;
+        CREATE TABLE IF NOT EXISTS {TASK_VOTING_OPTION_TABLE} (
+            id SERIAL PRIMARY KEY,
+            vote_id INTEGER NOT NULL,
+            option_index INTEGER NOT NULL,
+            task_id INTEGER,
+            evaluated_task VARCHAR(255),
+            FOREIGN KEY (vote_id) REFERENCES {TASK_VOTING_TABLE}(id) ON DELETE CASCADE,
+            FOREIGN KEY (task_id) REFERENCES {TASKS_TABLE}(id) ON DELETE SET NULL
+        )
+    """)
+
+def _migrate_vote_selected_option(cursor: "psycopg2.cursor"):
+    # Databases created before migrations were tracked may already have the column, and backfilling again would select options for the active vote
+    cursor.execute("SELECT 1 FROM information_schema.columns WHERE table_schema = current_schema() AND table_name = %s AND column_name = 'selected_option_id'", [TASK_VOTING_TABLE])
+    if cursor.fetchone() is not None:
+        return
+    cursor.execute(f"""
+        ALTER TABLE {TASK_VOTING_TABLE}
+        ADD COLUMN selected_option_id INTEGER REFERENCES {TASK_VOTING_OPTION_TABLE}(id) ON DELETE SET NULL
+    """)
+    cursor.execute(f"""UPDATE {TASK_VOTING_TABLE} SET selected_option_id = (SELECT MIN(id) FROM {TASK_VOTING_OPTION_TABLE} WHERE vote_id = {TASK_VOTING_TABLE}.id) WHERE selected_option_id IS NULL""")
+
+def _migrate_add_indexes(cursor: "psycopg2.cursor"):
+    cursor.execute(f"CREATE INDEX IF NOT EXISTS task_instances_type_end_time_idx ON {TASK_INSTANCES_TABLE} (task_type, end_time)")
+    cursor.execute(f"CREATE INDEX IF NOT EXISTS task_instances_drawn_prize_end_time_idx ON {TASK_INSTANCES_TABLE} (drawn_prize, end_time)")
+    cursor.execute(f"CREATE INDEX IF NOT EXISTS task_votes_active_idx ON {TASK_VOTING_TABLE} (completed) WHERE completed = false")
+    cursor.execute(f"CREATE INDEX IF NOT EXISTS task_completions_evidence_message_id_idx ON {TASK_COMPLETIONS_TABLE} (evidence_message_id)")
+    cursor.execute(f"CREATE INDEX IF NOT EXISTS task_vote_options_vote_id_idx ON {TASK_VOTING_OPTION_TABLE} (vote_id)")
+
+def _migrate_create_vote_ballots(cursor: "psycopg2.cursor"):
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {TASK_VOTING_BALLOT_TABLE} (
+            vote_id INTEGER NOT NULL,
+            user_id VARCHAR(128) NOT NULL,
+            option_index INTEGER NOT NULL,
+            PRIMARY KEY (vote_id, user_id, option_index),
+            FOREIGN KEY (vote_id) REFERENCES {TASK_VOTING_TABLE}(id) ON DELETE CASCADE
+        )
+    """)
+
+def _migrate_task_retired(cursor: "psycopg2.cursor"):
+    cursor.execute(f"ALTER TABLE {TASKS_TABLE} ADD COLUMN IF NOT EXISTS retired BOOLEAN NOT NULL DEFAULT false")
+
+# Append only, each migration runs once in its own transaction and is recorded in SCHEMA_MIGRATIONS_TABLE
+MIGRATIONS = [
+    (1, "Create tables", _migrate_create_tables),
+    (2, "Add task_votes.selected_option_id", _migrate_vote_selected_option),
+    (3, "Add indexes for task instance, vote and completion lookups", _migrate_add_indexes),
+    (4, "Create task_vote_ballots", _migrate_create_vote_ballots),
+    (5, "Add tasks.retired", _migrate_task_retired),
+]
+
+def run_migrations(connection: "psycopg2.connection"):
+    cursor = connection.cursor()
+    try:
+        cursor.execute("SELECT pg_advisory_lock(%s)", [SCHEMA_MIGRATIONS_LOCK_ID])
+        cursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS {SCHEMA_MIGRATIONS_TABLE} (
+                version INTEGER PRIMARY KEY,
+                description VARCHAR(255) NOT NULL,
+                applied_at TIMESTAMP NOT NULL DEFAULT NOW()
+            )
+        """)
+        connection.commit()
+        cursor.execute(f"SELECT version FROM {SCHEMA_MIGRATIONS_TABLE}")
+        applied_versions = set(row[0] for row in cursor.fetchall())
+        connection.commit()
+        for version, description, migrate in MIGRATIONS:
+            if version in applied_versions:
+                continue
+            try:
+                migrate(cursor)
+                cursor.execute(f"INSERT INTO {SCHEMA_MIGRATIONS_TABLE} (version, description) VALUES (%s, %s)", [version, description])
+                connection.commit()
+            except psycopg2.Error:
+                connection.rollback()
+                raise
+            logging.info(f"Applied schema migration {version}: {description}")
+    finally:
+        connection.rollback()
+        cursor.execute("SELECT pg_advisory_unlock(%s)", [SCHEMA_MIGRATIONS_LOCK_ID])
+        connection.commit()
+        cursor.close()
+
+class ConnectionPool:
+    def __init__(self, dsn: str, min_size: int = 1, max_size: int = 4, health_check_seconds: float = 10):
+        self.dsn = dsn
+        self.min_size = min_size
+        self.max_size = max(min_size, max_size)
+        self.health_check_seconds = health_check_seconds
+        # (connection, last returned to the pool)
+        self.idle: list[tuple["psycopg2.connection", float]] = []
+        self.size = 0
+        self.condition = threading.Condition()
+        for _ in range(self.min_size):
+            self.idle.append((self._connect(), time.monotonic()))
+            self.size += 1
+
+    def _connect(self) -> "psycopg2.connection":
+        return psycopg2.connect(dsn=self.dsn, connection_factory=PreparingConnection)
+
+    def _is_alive(self, connection: "psycopg2.connection", last_used: float) -> bool:
+        if connection.closed:
+            return False
+        # Only ping connections that have sat idle long enough for the server to have gone away
+        if time.monotonic() - last_used < self.health_check_seconds:
+            return True
+        try:
+            cursor = connection.cursor()
+            cursor.execute("SELECT 1")
+            cursor.close()
+            connection.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _close(self, connection: "psycopg2.connection"):
+        try:
+            connection.close()
+        except psycopg2.Error:
+            pass
+
+    def getconn(self) -> "psycopg2.connection":
+        with self.condition:
+            while True:
+                if self.idle:
+                    connection, last_used = self.idle.pop()
+                    break
+                if self.size < self.max_size:
+                    connection, last_used = None, None
+                    self.size += 1
+                    break
+                self.condition.wait()
+        if connection is not None:
+            if self._is_alive(connection, last_used):
+                return connection
+            logging.warning("Discarding dead database connection, reconnecting")
+            self._close(connection)
+        try:
+            return self._connect()
+        except psycopg2.Error:
+            with self.condition:
+                self.size -= 1
+                self.condition.notify()
+            raise
+
+    def putconn(self, connection: "psycopg2.connection", discard: bool = False):
+        if not discard and not connection.closed:
+            try:
+                if connection.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    connection.rollback()
+            except psycopg2.Error:
+                discard = True
+        if discard or connection.closed:
+            self._close(connection)
+            with self.condition:
+                self.size -= 1
+                self.condition.notify()
+            return
+        with self.condition:
+            self.idle.append((connection, time.monotonic()))
+            self.condition.notify()
+
+    @contextlib.contextmanager
+    def connection(self):
+        connection = self.getconn()
+        try:
+            yield connection
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            # The connection is likely broken (e.g. Postgres restarted), replace it on next checkout
+            self.putconn(connection, discard=True)
+            raise
+        except BaseException:
+            self.putconn(connection)
+            raise
+        else:
+            self.putconn(connection)
+
+    def close(self):
+        with self.condition:
+            for connection, _ in self.idle:
+                self._close(connection)
+            self.size -= len(self.idle)
+            self.idle = []
 
 class DatabaseConnection:
-    def __init__(self, dsn: str):
-        self.connection = psycopg2.connect(dsn=dsn)
+    def __init__(self, dsn: str, min_connections: int = 1, max_connections: int = 4, pool: ConnectionPool = None, clock: utils.Clock = None):
+        # pool can be provided to share connections or to substitute a stand-in (benchmarks)
+        self.pool = pool or ConnectionPool(dsn, min_size=min_connections, max_size=max_connections)
+        self.clock = clock or utils.Clock()
+        self.catalog: Union[TaskCatalog, None] = None
+        # Bumped on every invalidation so a catalog loaded concurrently with a write is not cached
+        self.catalog_generation = 0
+        self.catalog_lock = threading.Lock()
+        # Templates compiled by the task list loader, from the last sync_tasks
+        self.parsed_templates: dict[str, templates.ParsedTemplate] = {}
+
+    @contextlib.contextmanager
+    def transaction(self):
+        # Unit of work: statements run on one connection with commit=False and are committed once at the end
+        with self.pool.connection() as connection:
+            try:
+                yield connection
+                connection.commit()
+            except BaseException:
+                try:
+                    connection.rollback()
+                except psycopg2.Error:
+                    pass
+                raise
+
+    def select_with_model(self, model: Type[T], query: str, *vars) -> Union[T, None]:
+        with self.pool.connection() as connection:
+            return select_with_model(model, connection, query, *vars)
+
+    def select_multiple_with_model(self, model: Type[T], query: str, *vars) -> list[T]:
+        with self.pool.connection() as connection:
+            return select_multiple_with_model(model, connection, query, *vars)
+
+    def insert_model(self, model: T, table_name: str, return_col_name: str = None):
+        with self.pool.connection() as connection:
+            return insert_model(model, connection, table_name, return_col_name=return_col_name)
+
+    def update_model(self, model: T, table_name: str, fields: tuple[str, ...] = None):
+        with self.pool.connection() as connection:
+            update_model(model, connection, table_name, fields=fields)
+
+    def execute(self, query: str, *vars):
+        with self.pool.connection() as connection:
+            cursor = connection.cursor()
+            execute_query(cursor, query, vars)
+            cursor.close()
+            connection.commit()
+
+    def get_catalog(self) -> TaskCatalog:
+        with self.catalog_lock:
+            if self.catalog is not None:
+                return self.catalog
+            generation = self.catalog_generation
+        catalog = TaskCatalog(self.get_tasks(), self.parsed_templates)
+        with self.catalog_lock:
+            if generation == self.catalog_generation:
+                self.catalog = catalog
+        return catalog
+
+    def invalidate_catalog(self):
+        with self.catalog_lock:
+            self.catalog = None
+            self.catalog_generation += 1
 
     def get_tasks(self):
-        return select_multiple_with_model(Task, self.connection, f"SELECT * FROM {TASKS_TABLE} ORDER BY id ASC")
+        return self.select_multiple_with_model(Task, f"SELECT * FROM {TASKS_TABLE} ORDER BY id ASC")
 
     def get_standard_tasks(self):
-        return [task for task in self.get_tasks() if task.weight > 0]
+        return self.get_catalog().standard_tasks
 
     def get_task_by_id(self, task_id: int):
-        return select_with_model(Task, self.connection, f"SELECT * FROM {TASKS_TABLE} WHERE id = %s", task_id)
+        task = self.get_catalog().tasks_by_id.get(task_id)
+        # Copy so callers can modify the task before calling update_task without touching the cache
+        return dataclasses.replace(task) if task is not None else None
 
     def get_random_task(self):
-        return random.choice(self.get_standard_tasks())
+        return self.get_random_tasks(1)[0]
 
     def get_random_tasks(self, ntasks: int):
-        return random.sample(self.get_standard_tasks(), k=ntasks)
+        catalog = self.get_catalog()
+        return [catalog.standard_tasks[index] for index in catalog.sample_indices(ntasks)]
+
+    def get_random_parsed_tasks(self, ntasks: int):
+        catalog = self.get_catalog()
+        return [catalog.parsed_standard_tasks[index] for index in catalog.sample_indices(ntasks)]
 
     def insert_task(self, task: Task):
-        insert_model(task, self.connection, TASKS_TABLE)
+        self.insert_model(task, TASKS_TABLE)
+        self.invalidate_catalog()
 
     def get_max_task_id(self):
-        return select_with_model(int, self.connection, f"SELECT MAX(id) FROM {TASKS_TABLE}")
+        return self.select_with_model(int, f"SELECT MAX(id) FROM {TASKS_TABLE}")
 
     def insert_tasks(self, tasks: list[Task]):
-        for task in tasks:
-            try:
-                insert_model(task, self.connection, TASKS_TABLE)
-            except psycopg2.errors.UniqueViolation:
-                update_model(task, self.connection, TASKS_TABLE)
+        if len(tasks) == 0:
+            return
+        with self.pool.connection() as connection:
+            upsert_models(tasks, connection, TASKS_TABLE)
+        self.invalidate_catalog()
+
+    def sync_tasks(self, tasks: list[Task], parsed_templates: dict[str, templates.ParsedTemplate] = None) -> TaskSyncResult:
+        # Diff the task list against the catalog and only write what changed, so history keeps its task_id references.
+        # Lines are matched to stored tasks by content first, so a line that moved (e.g. a line inserted above it) keeps its
+        # stored id, then by id (line number) for lines edited in place. Unmatched lines are new and take their line number
+        # as id if it's free.
+        # A task with weight None keeps its current weight (DEFAULT_TASK_WEIGHT if new), including a weight of 0 set by an admin.
+        # Standard tasks missing from the list are marked retired rather than deleted, and un-retired when they come back.
+        if parsed_templates is not None:
+            self.parsed_templates = dict(parsed_templates)
+            self.invalidate_catalog()
+        current_tasks = self.get_catalog().tasks_by_id
+        standard_tasks = [task for task in current_tasks.values() if task.id < BONUS_TASK_MIN_ID]
+        matches: list[Union[Task, None]] = [None] * len(tasks)
+        matched_ids = set()
+        for index, task in enumerate(tasks):
+            existing_task = current_tasks.get(task.id)
+            if existing_task is not None and task_text_hash(existing_task) == task_text_hash(task):
+                matches[index] = existing_task
+                matched_ids.add(existing_task.id)
+        tasks_by_text: dict[str, list[Task]] = collections.defaultdict(list)
+        for existing_task in standard_tasks:
+            if existing_task.id not in matched_ids:
+                tasks_by_text[task_text_hash(existing_task)].append(existing_task)
+        for index, task in enumerate(tasks):
+            candidates = tasks_by_text.get(task_text_hash(task))
+            if matches[index] is None and candidates:
+                matches[index] = candidates.pop(0)
+                matched_ids.add(matches[index].id)
+        for index, task in enumerate(tasks):
+            existing_task = current_tasks.get(task.id)
+            if matches[index] is None and existing_task is not None and existing_task.id < BONUS_TASK_MIN_ID and existing_task.id not in matched_ids:
+                matches[index] = existing_task
+                matched_ids.add(existing_task.id)
+
+        result = TaskSyncResult()
+        changed_tasks = []
+        used_ids = set(current_tasks) | set(task.id for task in tasks)
+        next_id = max((task_id for task_id in used_ids if task_id < BONUS_TASK_MIN_ID), default=0) + 1
+        for task, existing_task in zip(tasks, matches):
+            task = dataclasses.replace(task, retired=False)
+            if existing_task is not None:
+                task.id = existing_task.id
+            elif task.id in current_tasks or task.id in matched_ids:
+                # Its line number belongs to a stored task that moved
+                task.id = next_id
+                next_id += 1
+            matched_ids.add(task.id)
+            if task.weight is None:
+                task.weight = existing_task.weight if existing_task is not None else DEFAULT_TASK_WEIGHT
+            if existing_task is None:
+                result.inserted += 1
+                changed_tasks.append(task)
+            elif task_content_hash(task) != task_content_hash(existing_task):
+                result.updated += 1
+                changed_tasks.append(task)
+        for existing_task in standard_tasks:
+            if existing_task.id not in matched_ids and not existing_task.retired:
+                result.retired += 1
+                changed_tasks.append(dataclasses.replace(existing_task, retired=True))
+        if len(changed_tasks) > 0:
+            with self.pool.connection() as connection:
+                upsert_models(changed_tasks, connection, TASKS_TABLE)
+            self.invalidate_catalog()
+        return result
 
     def delete_all_tasks(self):
-        cursor = self.connection.cursor()
-        cursor.execute(f"DELETE FROM {TASKS_TABLE}")
-        cursor.close()
-        self.connection.commit()
+        self.execute(f"DELETE FROM {TASKS_TABLE}")
+        self.invalidate_catalog()
 
     def update_task(self, task: Task):
-        update_model(task, self.connection, TASKS_TABLE)
+        self.update_model(task, TASKS_TABLE)
+        self.invalidate_catalog()
 
     def get_active_task_instance(self, task_type: str = TASK_TYPE_STANDARD):
-        return select_with_model(TaskInstance, self.connection, f"SELECT * FROM {TASK_INSTANCES_TABLE} WHERE end_time > %s AND task_type = %s", datetime.datetime.now(), task_type)
+        return self.select_with_model(TaskInstance, f"SELECT * FROM {TASK_INSTANCES_TABLE} WHERE end_time > %s AND task_type = %s", self.clock.now(), task_type)
 
     def get_task_instance_by_time(self, timestamp: datetime.datetime, task_type: str = TASK_TYPE_STANDARD):
-        return select_with_model(TaskInstance, self.connection, f"SELECT * FROM {TASK_INSTANCES_TABLE} WHERE end_time > %s AND start_time < %s AND task_type = %s", timestamp, timestamp, task_type)
+        return self.select_with_model(TaskInstance, f"SELECT * FROM {TASK_INSTANCES_TABLE} WHERE end_time > %s AND start_time < %s AND task_type = %s", timestamp, timestamp, task_type)
 
     def get_unclaimed_tasks(self):
-        return select_multiple_with_model(TaskInstance, self.connection, f"SELECT * FROM {TASK_INSTANCES_TABLE} WHERE drawn_prize = false AND end_time < %s ORDER BY end_time ASC", datetime.datetime.now())
+        return self.select_multiple_with_model(TaskInstance, f"SELECT * FROM {TASK_INSTANCES_TABLE} WHERE drawn_prize = false AND end_time < %s ORDER BY end_time ASC", self.clock.now())
 
     def get_completed_tasks_between(self, start: datetime.datetime, end: datetime.datetime):
-        return select_multiple_with_model(TaskInstance, self.connection, f"SELECT * FROM {TASK_INSTANCES_TABLE} WHERE end_time > %s AND end_time < %s ORDER BY end_time ASC", start, end)
-
-    def create_task_instance(self, new_task: TaskInstance):
-        active_instance = self.get_active_task_instance(task_type=new_task.task_type)
-        if active_instance is not None:
-            active_instance.end_time = datetime.datetime.now()
-            update_model(active_instance, self.connection, TASK_INSTANCES_TABLE)
-        task_id = insert_model(new_task, self.connection, TASK_INSTANCES_TABLE, return_col_name="id")
-        new_task.id = task_id
-
-    def update_task_instance(self, task_instance: TaskInstance):
-        update_model(task_instance, self.connection, TASK_INSTANCES_TABLE)
+        return self.select_multiple_with_model(TaskInstance, f"SELECT * FROM {TASK_INSTANCES_TABLE} WHERE end_time > %s AND end_time < %s ORDER BY end_time ASC", start, end)
+
+    def get_task_instances_by_ids(self, task_instance_ids: list[int]):
+        if len(task_instance_ids) == 0:
+            return []
+        return self.select_multiple_with_model(TaskInstance, f"SELECT * FROM {TASK_INSTANCES_TABLE} WHERE id = ANY(%s) ORDER BY end_time ASC", list(task_instance_ids))
+
+    def create_task_instance(self, new_task: TaskInstance, completed_vote: TaskVote = None):
+        # Ends the active instance of the same type, and optionally completes the vote that chose the task, in the same transaction
+        with self.transaction() as connection:
+            active_instance = select_with_model(TaskInstance, connection, f"SELECT * FROM {TASK_INSTANCES_TABLE} WHERE end_time > %s AND task_type = %s", self.clock.now(), new_task.task_type)
+            if active_instance is not None:
+                active_instance.end_time = self.clock.now()
+                update_model(active_instance, connection, TASK_INSTANCES_TABLE, fields=("end_time",), commit=False)
+            if completed_vote is not None:
+                completed_vote.completed = True
+                update_model(completed_vote, connection, TASK_VOTING_TABLE, fields=("completed",), commit=False)
+            task_id = insert_model(new_task, connection, TASK_INSTANCES_TABLE, return_col_name="id", commit=False)
+            new_task.id = task_id
+
+    def update_task_instance(self, task_instance: TaskInstance, *fields: str):
+        self.update_model(task_instance, TASK_INSTANCES_TABLE, fields=fields)
 
     def get_most_recent_task_instance(self, task_type: str = TASK_TYPE_STANDARD):
-        return select_with_model(TaskInstance, self.connection, f"SELECT * FROM {TASK_INSTANCES_TABLE} WHERE task_type = %s ORDER BY end_time DESC LIMIT 1", task_type)
+        return self.select_with_model(TaskInstance, f"SELECT * FROM {TASK_INSTANCES_TABLE} WHERE task_type = %s ORDER BY end_time DESC LIMIT 1", task_type)
 
     def get_task_completions(self, task_instance_id: int):
-        return select_multiple_with_model(TaskCompletion, self.connection, f"SELECT * FROM {TASK_COMPLETIONS_TABLE} WHERE instance_id = %s", task_instance_id)
+        return self.select_multiple_with_model(TaskCompletion, f"SELECT * FROM {TASK_COMPLETIONS_TABLE} WHERE instance_id = %s", task_instance_id)
+
+    def get_completions_for_task_instances(self, task_instance_ids: list[int]):
+        if len(task_instance_ids) == 0:
+            return []
+        return self.select_multiple_with_model(TaskCompletion, f"SELECT * FROM {TASK_COMPLETIONS_TABLE} WHERE instance_id = ANY(%s) ORDER BY id ASC", list(task_instance_ids))
 
     def add_task_completion(self, completion: TaskCompletion):
         try:
-            insert_model(completion, self.connection, TASK_COMPLETIONS_TABLE)
+            self.insert_model(completion, TASK_COMPLETIONS_TABLE)
             return True
         except psycopg2.errors.UniqueViolation:
             return False
 
     def remove_completions_from_message(self, evidence_message_id: str):
-        completions = select_multiple_with_model(TaskCompletion, self.connection, f"SELECT * FROM {TASK_COMPLETIONS_TABLE} WHERE evidence_message_id = %s", str(evidence_message_id))
-        cursor = self.connection.cursor()
-        cursor.execute(f"DELETE FROM {TASK_COMPLETIONS_TABLE} WHERE evidence_message_id = %s", [str(evidence_message_id)])
-        cursor.close()
-        self.connection.commit()
-        return completions
+        with self.transaction() as connection:
+            return select_multiple_with_model(TaskCompletion, connection, f"DELETE FROM {TASK_COMPLETIONS_TABLE} WHERE evidence_message_id = %s RETURNING *", str(evidence_message_id))
 
     def get_active_vote(self):
-        return select_with_model(TaskVote, self.connection, f"SELECT * FROM {TASK_VOTING_TABLE} WHERE completed = false")
+        return self.select_with_model(TaskVote, f"SELECT * FROM {TASK_VOTING_TABLE} WHERE completed = false")
 
-    def create_vote(self, vote: TaskVote):
-        vote_id = insert_model(vote, self.connection, TASK_VOTING_TABLE, return_col_name="id")
-        vote.id = vote_id
+    def create_vote(self, vote: TaskVote, options: list[TaskVoteOption] = None):
+        with self.transaction() as connection:
+            vote.id = insert_model(vote, connection, TASK_VOTING_TABLE, return_col_name="id", commit=False)
+            if options:
+                for option in options:
+                    option.vote_id = vote.id
+                self._insert_vote_options(options, connection)
 
-    def update_vote(self, vote: TaskVote):
-        update_model(vote, self.connection, TASK_VOTING_TABLE)
+    def update_vote(self, vote: TaskVote, *fields: str):
+        self.update_model(vote, TASK_VOTING_TABLE, fields=fields)
 
     def delete_vote(self, vote: TaskVote):
-        cursor = self.connection.cursor()
-        cursor.execute(f"DELETE FROM {TASK_VOTING_TABLE} WHERE id = %s", [vote.id])
-        cursor.close()
-        self.connection.commit()
+        self.execute(f"DELETE FROM {TASK_VOTING_TABLE} WHERE id = %s", vote.id)
 
     def add_vote_option(self, option: TaskVoteOption):
-        insert_model(option, self.connection, TASK_VOTING_OPTION_TABLE)
+        self.insert_model(option, TASK_VOTING_OPTION_TABLE)
+
+    def _insert_vote_options(self, options: list[TaskVoteOption], connection: "psycopg2.connection"):
+        option_ids = insert_models(options, connection, TASK_VOTING_OPTION_TABLE, return_col_name="id", commit=False)
+        for option, option_id in zip(options, option_ids):
+            option.id = option_id
+
+    def add_vote_options(self, options: list[TaskVoteOption]):
+        if len(options) == 0:
+            return
+        with self.transaction() as connection:
+            self._insert_vote_options(options, connection)
 
     def get_vote_options(self, task_vote_id: int):
-        return select_multiple_with_model(TaskVoteOption, self.connection, f"SELECT * FROM {TASK_VOTING_OPTION_TABLE} WHERE vote_id = %s ORDER BY option_index ASC", task_vote_id)
+        return self.select_multiple_with_model(TaskVoteOption, f"SELECT * FROM {TASK_VOTING_OPTION_TABLE} WHERE vote_id = %s ORDER BY option_index ASC", task_vote_id)
 
     def get_vote_option_by_id(self, option_id: int):
-        return select_with_model(TaskVoteOption, self.connection, f"SELECT * FROM {TASK_VOTING_OPTION_TABLE} WHERE id = %s", option_id)
+        return self.select_with_model(TaskVoteOption, f"SELECT * FROM {TASK_VOTING_OPTION_TABLE} WHERE id = %s", option_id)
+
+    def add_vote_ballot(self, ballot: TaskVoteBallot):
+        self.execute(f"INSERT INTO {TASK_VOTING_BALLOT_TABLE} (vote_id, user_id, option_index) VALUES (%s, %s, %s) ON CONFLICT DO NOTHING", ballot.vote_id, str(ballot.user_id), ballot.option_index)
+
+    def remove_vote_ballot(self, ballot: TaskVoteBallot):
+        self.execute(f"DELETE FROM {TASK_VOTING_BALLOT_TABLE} WHERE vote_id = %s AND user_id = %s AND option_index = %s", ballot.vote_id, str(ballot.user_id), ballot.option_index)
+
+    def get_vote_ballots(self, vote_id: int):
+        return self.select_multiple_with_model(TaskVoteBallot, f"SELECT vote_id, user_id, option_index FROM {TASK_VOTING_BALLOT_TABLE} WHERE vote_id = %s", vote_id)
+
+    def ping(self):
+        return self.select_with_model(int, "SELECT 1")
 
     def initialize(self):
-        cursor = self.connection.cursor()
-        cursor.execute(f"""
-            --DROP TABLE IF EXISTS {TASKS_TABLE} CASCADE;
-            CREATE TABLE IF NOT EXISTS {TASKS_TABLE} (
-                id INTEGER PRIMARY KEY,
-                description VARCHAR(255) NOT NULL,
-                instruction VARCHAR(255) NOT NULL,
-                weight INTEGER NOT NULL
-            )
-        """)
-        cursor.execute(f"""
-            --DROP TABLE IF EXISTS {TASK_INSTANCES_TABLE} CASCADE;
-            CREATE TABLE IF NOT EXISTS {TASK_INSTANCES_TABLE} (
-                id SERIAL PRIMARY KEY,
-                task_id INTEGER,
-                task_type VARCHAR(64) NOT NULL,
-                evaluated_task VARCHAR(255) NOT NULL,
-                start_time TIMESTAMP NOT NULL,
-                end_time TIMESTAMP,
-                channel_id VARCHAR(128),
-                message_id VARCHAR(128),
-                drawn_prize BOOLEAN,
-                FOREIGN KEY (task_id) REFERENCES {TASKS_TABLE}(id) ON DELETE SET NULL
-            )
-        """)
-        cursor.execute(f"""
-            --DROP TABLE IF EXISTS {TASK_COMPLETIONS_TABLE} CASCADE;
-            CREATE TABLE IF NOT EXISTS {TASK_COMPLETIONS_TABLE} (
-                id SERIAL PRIMARY KEY,
-                instance_id INTEGER NOT NULL,
-                user_id VARCHAR(128),
-                approver_id VARCHAR(128),
-                completion_time TIMESTAMP,
-                evidence_channel_id VARCHAR(128),
-                evidence_message_id VARCHAR(128),
-                FOREIGN KEY (instance_id) REFERENCES {TASK_INSTANCES_TABLE}(id) ON DELETE CASCADE,
-                UNIQUE (instance_id, user_id)
-            )
-        """)
-        cursor.execute(f"""
-            --DROP TABLE IF EXISTS {TASK_VOTING_TABLE} CASCADE;
-            CREATE TABLE IF NOT EXISTS {TASK_VOTING_TABLE} (
-                id SERIAL PRIMARY KEY,
-                start_time TIMESTAMP,
-                end_time TIMESTAMP,
-                completed BOOLEAN,
-                voting_channel_id VARCHAR(128),
-                voting_message_id VARCHAR(128)
-            )
-        """)
-        cursor.execute(f"""
-            --DROP TABLE IF EXISTS {TASK_VOTING_OPTION_TABLE} CASCADE;
-            CREATE TABLE IF NOT EXISTS {TASK_VOTING_OPTION_TABLE} (
-                id SERIAL PRIMARY KEY,
-                vote_id INTEGER NOT NULL,
-                option_index INTEGER NOT NULL,
-                task_id INTEGER,
-                evaluated_task VARCHAR(255),
-                FOREIGN KEY (vote_id) REFERENCES {TASK_VOTING_TABLE}(id) ON DELETE CASCADE,
-                FOREIGN KEY (task_id) REFERENCES {TASKS_TABLE}(id) ON DELETE SET NULL
-            )
-        """)
-        cursor.close()
-        self.connection.commit()
+        with self.pool.connection() as connection:
+            run_migrations(connection)
 
-        cursor = self.connection.cursor()
-        try:
-            cursor.execute(f"""
-                ALTER TABLE {TASK_VOTING_TABLE}
-                ADD COLUMN selected_option_id INTEGER REFERENCES {TASK_VOTING_OPTION_TABLE}(id) ON DELETE SET NULL
-            """)
-            cursor.execute(f"""UPDATE {TASK_VOTING_TABLE} SET selected_option_id = (SELECT MIN(id) FROM {TASK_VOTING_OPTION_TABLE} WHERE vote_id = {TASK_VOTING_TABLE}.id) WHERE selected_option_id IS NULL""")
-        except psycopg2.errors.DuplicateColumn:
-            pass
-        cursor.close()
-        self.connection.commit()
+def _timed_call(func, submitted: float, *args, **kwargs):
+    started = time.perf_counter()
+    name = getattr(func, "__name__", "unknown")
+    metrics.DB_WAIT_SECONDS.observe(started - submitted, name)
+    try:
+        return func(*args, **kwargs)
+    except Exception:
+        metrics.DB_ERRORS.inc(name)
+        raise
+    finally:
+        metrics.DB_QUERY_SECONDS.observe(time.perf_counter() - started, name)
+
+def _run_in_executor(method):
+    @functools.wraps(method)
+    async def wrapper(self: "AsyncDatabaseConnection", *args, **kwargs):
+        # Looked up on the instance so any object with the DatabaseConnection interface can be wrapped (e.g. the simulator's in-memory database)
+        return await self.run(getattr(self.database, method.__name__), *args, **kwargs)
+    return wrapper
+
+# psycopg2 calls block, so the bot awaits the database through this wrapper which runs every
+# query on a dedicated executor instead of the discord.py event loop.
+# One worker per pooled connection so concurrent queries don't queue behind each other.
+class AsyncDatabaseConnection:
+    def __init__(self, database: DatabaseConnection, executor: concurrent.futures.Executor = None):
+        self.database = database
+        self.executor = executor or concurrent.futures.ThreadPoolExecutor(max_workers=database.pool.max_size, thread_name_prefix="database")
+
+    async def run(self, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(_timed_call, func, time.perf_counter(), *args, **kwargs))
+
+    select_with_model = _run_in_executor(DatabaseConnection.select_with_model)
+    select_multiple_with_model = _run_in_executor(DatabaseConnection.select_multiple_with_model)
+    insert_model = _run_in_executor(DatabaseConnection.insert_model)
+    update_model = _run_in_executor(DatabaseConnection.update_model)
+    execute = _run_in_executor(DatabaseConnection.execute)
+    get_catalog = _run_in_executor(DatabaseConnection.get_catalog)
+    invalidate_catalog = _run_in_executor(DatabaseConnection.invalidate_catalog)
+    get_tasks = _run_in_executor(DatabaseConnection.get_tasks)
+    get_standard_tasks = _run_in_executor(DatabaseConnection.get_standard_tasks)
+    get_task_by_id = _run_in_executor(DatabaseConnection.get_task_by_id)
+    get_random_task = _run_in_executor(DatabaseConnection.get_random_task)
+    get_random_tasks = _run_in_executor(DatabaseConnection.get_random_tasks)
+    get_random_parsed_tasks = _run_in_executor(DatabaseConnection.get_random_parsed_tasks)
+    insert_task = _run_in_executor(DatabaseConnection.insert_task)
+    get_max_task_id = _run_in_executor(DatabaseConnection.get_max_task_id)
+    insert_tasks = _run_in_executor(DatabaseConnection.insert_tasks)
+    sync_tasks = _run_in_executor(DatabaseConnection.sync_tasks)
+    delete_all_tasks = _run_in_executor(DatabaseConnection.delete_all_tasks)
+    update_task = _run_in_executor(DatabaseConnection.update_task)
+    get_active_task_instance = _run_in_executor(DatabaseConnection.get_active_task_instance)
+    get_task_instance_by_time = _run_in_executor(DatabaseConnection.get_task_instance_by_time)
+    get_unclaimed_tasks = _run_in_executor(DatabaseConnection.get_unclaimed_tasks)
+    get_completed_tasks_between = _run_in_executor(DatabaseConnection.get_completed_tasks_between)
+    get_task_instances_by_ids = _run_in_executor(DatabaseConnection.get_task_instances_by_ids)
+    create_task_instance = _run_in_executor(DatabaseConnection.create_task_instance)
+    update_task_instance = _run_in_executor(DatabaseConnection.update_task_instance)
+    get_most_recent_task_instance = _run_in_executor(DatabaseConnection.get_most_recent_task_instance)
+    get_task_completions = _run_in_executor(DatabaseConnection.get_task_completions)
+    get_completions_for_task_instances = _run_in_executor(DatabaseConnection.get_completions_for_task_instances)
+    add_task_completion = _run_in_executor(DatabaseConnection.add_task_completion)
+    remove_completions_from_message = _run_in_executor(DatabaseConnection.remove_completions_from_message)
+    get_active_vote = _run_in_executor(DatabaseConnection.get_active_vote)
+    create_vote = _run_in_executor(DatabaseConnection.create_vote)
+    update_vote = _run_in_executor(DatabaseConnection.update_vote)
+    delete_vote = _run_in_executor(DatabaseConnection.delete_vote)
+    add_vote_option = _run_in_executor(DatabaseConnection.add_vote_option)
+    add_vote_options = _run_in_executor(DatabaseConnection.add_vote_options)
+    get_vote_options = _run_in_executor(DatabaseConnection.get_vote_options)
+    get_vote_option_by_id = _run_in_executor(DatabaseConnection.get_vote_option_by_id)
+    add_vote_ballot = _run_in_executor(DatabaseConnection.add_vote_ballot)
+    remove_vote_ballot = _run_in_executor(DatabaseConnection.remove_vote_ballot)
+    get_vote_ballots = _run_in_executor(DatabaseConnection.get_vote_ballots)
+    ping = _run_in_executor(DatabaseConnection.ping)
+    initialize = _run_in_executor(DatabaseConnection.initialize)
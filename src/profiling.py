@@ -0,0 +1,115 @@
+import asyncio
+import collections
+import dataclasses
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from typing import Union
+
+import metrics
+
+class LoopMonitor:
+    # A task on the loop wakes every interval_seconds and records how late it was woken (scheduling lag).
+    # A watchdog thread watches the same heartbeat, and if the loop stops beating for longer than slow_callback_seconds
+    # it captures the loop thread's stack while the offending callback is still running.
+    def __init__(self, interval_seconds: float = 0.5, slow_callback_seconds: float = 0.25):
+        self.interval_seconds = interval_seconds
+        self.slow_callback_seconds = slow_callback_seconds
+        self.last_beat = time.monotonic()
+        self.loop_thread_id: Union[int, None] = None
+        self.task: Union[asyncio.Task, None] = None
+        self.watchdog: Union[threading.Thread, None] = None
+
+    def start(self):
+        if self.task is not None:
+            return
+        self.loop_thread_id = threading.get_ident()
+        self.last_beat = time.monotonic()
+        self.task = asyncio.create_task(self._sample_lag())
+        self.watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self.watchdog.start()
+
+    async def _sample_lag(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval_seconds
+            await asyncio.sleep(self.interval_seconds)
+            lag = max(loop.time() - expected, 0)
+            self.last_beat = time.monotonic()
+            metrics.EVENT_LOOP_LAG_SECONDS.observe(lag)
+            if lag > self.slow_callback_seconds:
+                logging.warning(f"Event loop lagged {lag * 1000:.0f}ms")
+
+    def _watch(self):
+        reported_beat = None
+        while True:
+            time.sleep(self.slow_callback_seconds / 2)
+            beat = self.last_beat
+            stalled = time.monotonic() - beat - self.interval_seconds
+            # One report per stall, the next beat ends it
+            if stalled > self.slow_callback_seconds and beat != reported_beat:
+                reported_beat = beat
+                metrics.SLOW_CALLBACKS.inc()
+                frame = sys._current_frames().get(self.loop_thread_id)
+                stack = "".join(traceback.format_stack(frame)) if frame is not None else "<unavailable>\n"
+                logging.warning(f"Event loop blocked for over {stalled * 1000:.0f}ms, loop thread stack:\n{stack}")
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    # ';' separates frames in the collapsed format
+    name = getattr(code, "co_qualname", code.co_name).replace(";", ":")
+    return f"{name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+@dataclasses.dataclass
+class ProfileReport:
+    duration_seconds: float
+    sample_count: int
+    # Collapsed stacks ("thread;outer;...;inner" -> samples), as read by flamegraph.pl and speedscope
+    stacks: collections.Counter
+
+    def self_samples(self) -> collections.Counter:
+        leaves = collections.Counter()
+        for stack, count in self.stacks.items():
+            leaves[stack.rsplit(";", 1)[-1]] += count
+        return leaves
+
+    def write(self, filename: str):
+        os.makedirs(os.path.dirname(filename) or ".", exist_ok=True)
+        with open(filename, "w", encoding="utf-8") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+class SamplingProfiler:
+    # Samples the stacks of every thread (except its own) from a background thread, so it can run against the live bot.
+    # Stacks are rooted at the thread name, keeping the event loop separate from the database executor threads.
+    def __init__(self, interval_seconds: float = 0.005, max_depth: int = 128):
+        self.interval_seconds = interval_seconds
+        self.max_depth = max_depth
+
+    def _collapse(self, frame) -> list[str]:
+        names = []
+        while frame is not None and len(names) < self.max_depth:
+            names.append(_frame_name(frame))
+            frame = frame.f_back
+        names.reverse()
+        return names
+
+    def run(self, duration_seconds: float) -> ProfileReport:
+        own_thread_id = threading.get_ident()
+        stacks = collections.Counter()
+        sample_count = 0
+        start = time.monotonic()
+        deadline = start + duration_seconds
+        while time.monotonic() < deadline:
+            thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_thread_id:
+                    continue
+                stack = [thread_names.get(thread_id, str(thread_id)).replace(";", ":")] + self._collapse(frame)
+                stacks[";".join(stack)] += 1
+            sample_count += 1
+            time.sleep(self.interval_seconds)
+        return ProfileReport(duration_seconds=time.monotonic() - start, sample_count=sample_count, stacks=stacks)
@@ -0,0 +1,97 @@
+import asyncio
+import dataclasses
+import datetime
+import heapq
+import itertools
+import logging
+import time
+from typing import Awaitable, Callable
+
+import metrics
+import utils
+
+@dataclasses.dataclass
+class ScheduledJob:
+    # Identifies the transition (e.g. ("finish_vote", vote_id)) so a job that is still due after running is retried later instead of spinning
+    key: tuple
+    due_time: datetime.datetime
+    callback: Callable[[], Awaitable[None]]
+
+class DeadlineScheduler:
+    def __init__(
+        self,
+        compute_jobs: Callable[[], Awaitable[list[ScheduledJob]]],
+        retry_seconds: float = 10,
+        max_sleep_seconds: float = 300,
+        clock: utils.Clock = None,
+    ):
+        # compute_jobs derives the pending transitions from the current database state
+        self.compute_jobs = compute_jobs
+        self.retry_seconds = retry_seconds
+        self.max_sleep_seconds = max_sleep_seconds
+        self.clock = clock or utils.Clock()
+        self.last_run: dict[tuple, datetime.datetime] = {}
+        self.rearm_event = asyncio.Event()
+        self.counter = itertools.count()
+
+    def now(self) -> datetime.datetime:
+        return self.clock.now()
+
+    def rearm(self):
+        self.rearm_event.set()
+
+    async def _wait(self, seconds: float) -> bool:
+        try:
+            await asyncio.wait_for(self.rearm_event.wait(), timeout=max(seconds, 0))
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def _build_heap(self, jobs: list[ScheduledJob]) -> list:
+        active_keys = set(job.key for job in jobs)
+        self.last_run = {key: time for key, time in self.last_run.items() if key in active_keys}
+        heap = []
+        for job in jobs:
+            due_time = job.due_time
+            last_run = self.last_run.get(job.key)
+            if last_run is not None:
+                due_time = max(due_time, last_run + datetime.timedelta(seconds=self.retry_seconds))
+            heap.append((due_time, next(self.counter), job))
+        heapq.heapify(heap)
+        return heap
+
+    async def run(self):
+        while True:
+            self.rearm_event.clear()
+            try:
+                compute_start = time.perf_counter()
+                jobs = await self.compute_jobs()
+                metrics.SCHEDULER_COMPUTE_SECONDS.observe(time.perf_counter() - compute_start)
+                heap = self._build_heap(jobs)
+            except Exception:
+                logging.exception("Failed to compute scheduled jobs")
+                await self._wait(self.retry_seconds)
+                continue
+
+            if not heap:
+                await self._wait(self.max_sleep_seconds)
+                continue
+
+            due_time, _, job = heap[0]
+            delay = (due_time - self.now()).total_seconds()
+            if delay > 0:
+                # Woken early either by a rearm or by the periodic resync, both recompute the jobs
+                await self._wait(min(delay, self.max_sleep_seconds))
+                continue
+
+            heapq.heappop(heap)
+            self.last_run[job.key] = self.now()
+            job_name = str(job.key[0])
+            job_start = time.perf_counter()
+            try:
+                await job.callback()
+            except Exception:
+                metrics.SCHEDULER_JOB_FAILURES.inc(job_name)
+                logging.exception(f"Scheduled job {job.key} failed")
+            finally:
+                metrics.SCHEDULER_JOB_SECONDS.observe(time.perf_counter() - job_start, job_name)
@@ -0,0 +1,131 @@
+import dataclasses
+import random
+from collections import defaultdict
+from typing import Any, Callable, Union
+
+import model
+
+@dataclasses.dataclass
+class TaskStats:
+    tasks: list[model.TaskInstance]
+    completions: list[model.TaskCompletion]
+    # Indexes built once in __post_init__ so the getters don't rescan the completions
+    tasks_by_type: dict[str, list[model.TaskInstance]] = dataclasses.field(init=False)
+    completions_by_type: dict[str, list[model.TaskCompletion]] = dataclasses.field(init=False)
+    completions_by_user: dict[int, dict[str, list[model.TaskCompletion]]] = dataclasses.field(init=False)
+
+    def __post_init__(self):
+        self.tasks_by_type = defaultdict(list)
+        for task in self.tasks:
+            self.tasks_by_type[task.task_type].append(task)
+        task_types = {task.id: task.task_type for task in self.tasks}
+        self.completions_by_type = defaultdict(list)
+        self.completions_by_user = defaultdict(lambda: defaultdict(list))
+        for completion in self.completions:
+            task_type = task_types.get(completion.instance_id)
+            self.completions_by_type[task_type].append(completion)
+            self.completions_by_user[int(completion.user_id)][task_type].append(completion)
+
+    def has_completions(self):
+        return len(self.completions) > 0
+
+    def get_standard_tasks(self) -> list[model.TaskInstance]:
+        return self.tasks_by_type.get(model.TASK_TYPE_STANDARD, [])
+
+    def get_bonus_tasks(self) -> list[model.TaskInstance]:
+        return self.tasks_by_type.get(model.TASK_TYPE_BONUS, [])
+
+    def get_standard_task_completions(self) -> list[model.TaskCompletion]:
+        return self.completions_by_type.get(model.TASK_TYPE_STANDARD, [])
+
+    def get_bonus_task_completions(self) -> list[model.TaskCompletion]:
+        return self.completions_by_type.get(model.TASK_TYPE_BONUS, [])
+
+    def get_unique_user_ids(self) -> list[int]:
+        return list(self.completions_by_user.keys())
+
+    def get_completions_for_user(self, user_id: int) -> tuple[list[model.TaskCompletion], list[model.TaskCompletion]]:
+        user_completions = self.completions_by_user.get(int(user_id), {})
+        return user_completions.get(model.TASK_TYPE_STANDARD, []), user_completions.get(model.TASK_TYPE_BONUS, [])
+
+WINNER_WEIGHTING_COMPLETION = "completion"
+WINNER_WEIGHTING_USER = "user"
+
+@dataclasses.dataclass
+class WinnerDraw:
+    seed: int
+    entry_count: int
+    winner_user_id: Union[int, None]
+    winner: Any
+
+def build_draw_entries(task_stats: TaskStats, weighting: str = WINNER_WEIGHTING_COMPLETION, bonus_multiplier: int = 1) -> list[int]:
+    # One user id per ticket, in a deterministic order so a seeded draw can be reproduced
+    entries = []
+    if weighting == WINNER_WEIGHTING_COMPLETION:
+        # A ticket per completion, bonus completions are worth bonus_multiplier tickets
+        bonus_task_ids = set(task.id for task in task_stats.get_bonus_tasks())
+        for completion in task_stats.completions:
+            tickets = bonus_multiplier if completion.instance_id in bonus_task_ids else 1
+            entries += [int(completion.user_id)] * tickets
+    elif weighting == WINNER_WEIGHTING_USER:
+        # A ticket per participant, multiplied if they completed any bonus task
+        for user_id in sorted(task_stats.get_unique_user_ids()):
+            _, bonus_completions = task_stats.get_completions_for_user(user_id)
+            entries += [user_id] * (bonus_multiplier if bonus_completions else 1)
+    else:
+        raise ValueError(f"Unknown winner weighting: {weighting}")
+    return entries
+
+def draw_winner(
+    task_stats: TaskStats,
+    resolve_users: Callable[[list[int]], dict[int, Any]],
+    weighting: str = WINNER_WEIGHTING_COMPLETION,
+    bonus_multiplier: int = 1,
+    seed: int = None,
+) -> WinnerDraw:
+    # resolve_users maps user ids to users in one batch, users that can't be resolved (e.g. left the server) are skipped
+    if seed is None:
+        seed = random.SystemRandom().randrange(2 ** 32)
+    rng = random.Random(seed)
+    entries = build_draw_entries(task_stats, weighting=weighting, bonus_multiplier=bonus_multiplier)
+    entry_count = len(entries)
+    users = resolve_users(sorted(set(entries)))
+    while entries:
+        index = rng.randrange(len(entries))
+        user_id = entries[index]
+        user = users.get(user_id)
+        if user is not None:
+            return WinnerDraw(seed=seed, entry_count=entry_count, winner_user_id=user_id, winner=user)
+        # Swap-pop the rejected ticket in O(1)
+        entries[index] = entries[-1]
+        entries.pop()
+    return WinnerDraw(seed=seed, entry_count=entry_count, winner_user_id=None, winner=None)
+
+class VoteTally:
+    # Votes for the active vote kept up to date from gateway reaction events, one vote per (user, option)
+    def __init__(self, vote_id: int, voting_message_id: str, option_count: int):
+        self.vote_id = vote_id
+        self.voting_message_id = str(voting_message_id)
+        self.voters: list[set[int]] = [set() for _ in range(option_count)]
+
+    def add(self, option_index: int, user_id: int) -> bool:
+        if option_index >= len(self.voters) or user_id in self.voters[option_index]:
+            return False
+        self.voters[option_index].add(user_id)
+        return True
+
+    def remove(self, option_index: int, user_id: int) -> bool:
+        if option_index >= len(self.voters) or user_id not in self.voters[option_index]:
+            return False
+        self.voters[option_index].remove(user_id)
+        return True
+
+    def counts(self) -> list[int]:
+        return [len(voters) for voters in self.voters]
+
+    def leader(self) -> Union[int, None]:
+        # Ties go to the lowest option index
+        if len(self.voters) == 0:
+            return None
+        counts = self.counts()
+        return counts.index(max(counts))
@@ -0,0 +1,138 @@
+import dataclasses
+import hashlib
+import json
+import logging
+import os
+from typing import Iterator, Union
+
+import model
+import templates
+
+# Matches the VARCHAR(255) columns of the tasks table
+MAX_FIELD_LENGTH = 255
+CACHE_VERSION = 2
+
+class TaskFileError(Exception):
+    def __init__(self, filename: str, line_number: int, message: str):
+        super().__init__(f"{filename}:{line_number}: {message}")
+        self.filename = filename
+        self.line_number = line_number
+        self.message = message
+
+@dataclasses.dataclass
+class TaskList:
+    tasks: list[model.Task]
+    errors: list[TaskFileError]
+    # Description -> compiled template, handed to the catalog so it doesn't parse the descriptions again
+    parsed_templates: dict[str, templates.ParsedTemplate]
+
+def parse_task_line(filename: str, line_number: int, line: str, parsed_templates: dict[str, templates.ParsedTemplate] = None) -> model.Task:
+    # Format is "description;instruction" with an optional ";weight"
+    parts = line.split(";")
+    if len(parts) not in (2, 3):
+        raise TaskFileError(filename, line_number, f"Expected 'description;instruction[;weight]', found {len(parts)} fields")
+    description, instruction = parts[0], parts[1]
+    if not description.strip() or not instruction.strip():
+        raise TaskFileError(filename, line_number, "Description and instruction must not be empty")
+    if len(description) > MAX_FIELD_LENGTH or len(instruction) > MAX_FIELD_LENGTH:
+        raise TaskFileError(filename, line_number, f"Description and instruction must be at most {MAX_FIELD_LENGTH} characters")
+    weight = None
+    if len(parts) == 3:
+        try:
+            weight = int(parts[2])
+        except ValueError:
+            raise TaskFileError(filename, line_number, f"Invalid weight '{parts[2].strip()}'")
+        if weight < 0:
+            raise TaskFileError(filename, line_number, "Weight must not be negative")
+    try:
+        parsed_template = templates.ParsedTemplate(description)
+    except templates.TemplateFormatException as e:
+        raise TaskFileError(filename, line_number, str(e))
+    if parsed_templates is not None:
+        parsed_templates[description] = parsed_template
+    return model.Task(
+        # The line number, used as the id of new tasks. sync_tasks matches existing tasks by content first, so moved lines keep their id
+        id=line_number,
+        description=description,
+        instruction=instruction,
+        weight=weight,
+    )
+
+def iter_tasks(filename: str, errors: list[TaskFileError], parsed_templates: dict[str, templates.ParsedTemplate] = None) -> Iterator[model.Task]:
+    with open(filename, "r", encoding="utf-8") as f:
+        for index, line in enumerate(f):
+            line = line.rstrip("\r\n")
+            if not line.strip():
+                continue
+            try:
+                yield parse_task_line(filename, index + 1, line, parsed_templates)
+            except TaskFileError as e:
+                errors.append(e)
+
+def _file_hash(filename: str) -> str:
+    digest = hashlib.sha256()
+    with open(filename, "rb") as f:
+        for chunk in iter(lambda: f.read(65536), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _dump_ops(parsed_template: templates.ParsedTemplate) -> list:
+    # Literal text as strings, slots as [min, max, rounding]
+    return [op if isinstance(op, str) else [op.min, op.max, op.rounding] for op in parsed_template.ops]
+
+def _load_ops(ops: list) -> list[Union[str, templates.RandomComponent]]:
+    return [op if isinstance(op, str) else templates.RandomComponent(*op) for op in ops]
+
+def _read_cache(cache_filename: str) -> Union[dict, None]:
+    try:
+        with open(cache_filename, "r", encoding="utf-8") as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(cache, dict) or cache.get("version") != CACHE_VERSION:
+        return None
+    return cache
+
+def _write_cache(cache_filename: str, cache: dict):
+    temp_filename = f"{cache_filename}.tmp"
+    try:
+        with open(temp_filename, "w", encoding="utf-8") as f:
+            json.dump(cache, f)
+        os.replace(temp_filename, cache_filename)
+    except OSError:
+        logging.warning(f"Failed to write task cache {cache_filename}", exc_info=True)
+
+def load_tasks(filename: str, cache_filename: str = None) -> TaskList:
+    # The parsed tasks and their compiled templates are cached next to the task file, keyed by its mtime and content hash
+    cache_filename = cache_filename or f"{filename}.cache.json"
+    mtime_ns = os.stat(filename).st_mtime_ns
+    cache = _read_cache(cache_filename)
+    file_hash = None
+    if cache is not None and cache.get("mtime_ns") != mtime_ns:
+        file_hash = _file_hash(filename)
+        if cache.get("sha256") != file_hash:
+            cache = None
+        else:
+            # Touched but unchanged, refresh the mtime so the next load skips hashing
+            cache["mtime_ns"] = mtime_ns
+            _write_cache(cache_filename, cache)
+
+    if cache is not None:
+        return TaskList(
+            tasks=[model.Task(**task) for task in cache["tasks"]],
+            errors=[TaskFileError(filename, line_number, message) for line_number, message in cache["errors"]],
+            parsed_templates={description: templates.ParsedTemplate.from_ops(description, _load_ops(ops)) for description, ops in cache["templates"].items()},
+        )
+
+    errors: list[TaskFileError] = []
+    parsed_templates: dict[str, templates.ParsedTemplate] = {}
+    tasks = list(iter_tasks(filename, errors, parsed_templates))
+    _write_cache(cache_filename, {
+        "version": CACHE_VERSION,
+        "mtime_ns": mtime_ns,
+        "sha256": file_hash or _file_hash(filename),
+        "tasks": [dataclasses.asdict(task) for task in tasks],
+        "errors": [[error.line_number, error.message] for error in errors],
+        "templates": {description: _dump_ops(parsed_template) for description, parsed_template in parsed_templates.items()},
+    })
+    return TaskList(tasks=tasks, errors=errors, parsed_templates=parsed_templates)
@@ -6,60 +6,92 @@ from typing import Union
 class TemplateFormatException(Exception):
     pass
 
+DETECTION_PATTERN = re.compile(r"\{[^\}]*\}")
+PARSING_PATTERN = re.compile(r"\{\s*(\d+)\s*,\s*(\d+)\s*(?:,\s*(\d+)\s*)?\s*\}")
+
 @dataclasses.dataclass
 class RandomComponent:
     min: int
     max: int
     rounding: int = 1
 
-    def evaluate(self) -> int:
-        value = random.randint(self.min, self.max)
+    def _round(self, value: int) -> int:
         return int(round(value / float(self.rounding)) * self.rounding)
 
+    def evaluate(self, rng: random.Random = random) -> int:
+        return self._round(rng.randint(self.min, self.max))
+
+    def evaluate_many(self, count: int, rng: random.Random = random) -> list[int]:
+        # One choices() call draws every value for this component
+        values = rng.choices(range(self.min, self.max + 1), k=count)
+        if self.rounding == 1:
+            return values
+        return [self._round(value) for value in values]
+
 class ParsedTemplate:
     def __init__(self, template: str):
         self.template = template
-        self.parts: list[Union[str, None]] = []
+        # Flat list of ops, literal text is stored as-is and each slot holds its RandomComponent
+        self.ops: list[Union[str, RandomComponent]] = []
         self.random_components: list[RandomComponent] = []
+        # (index into ops, component) for every slot, so evaluate only touches the slots
+        self.slots: list[tuple[int, RandomComponent]] = []
         self._parse_template(template)
 
+    @classmethod
+    def from_ops(cls, template: str, ops: list[Union[str, RandomComponent]]) -> "ParsedTemplate":
+        # Rebuilds a template compiled earlier (the task list cache) without parsing it again
+        parsed_template = cls.__new__(cls)
+        parsed_template.template = template
+        parsed_template.ops = list(ops)
+        parsed_template.random_components = [op for op in ops if isinstance(op, RandomComponent)]
+        parsed_template.slots = [(index, op) for index, op in enumerate(ops) if isinstance(op, RandomComponent)]
+        return parsed_template
+
     def get_template(self) -> str:
         return self.template
 
-    def evaluate(self) -> str:
-        result = ""
-        component_index = 0
-        for part in self.parts:
-            if part is None:
-                component = self.random_components[component_index]
-                result += str(component.evaluate())
-                component_index += 1
-            else:
-                result += part
-        return result
+    def evaluate(self, rng: random.Random = random) -> str:
+        parts = list(self.ops)
+        for index, component in self.slots:
+            parts[index] = str(component.evaluate(rng))
+        return "".join(parts)
+
+    def evaluate_many(self, count: int, rng: random.Random = random) -> list[str]:
+        if not self.slots:
+            return [self.template] * count
+        slot_values = [component.evaluate_many(count, rng) for _, component in self.slots]
+        results = []
+        parts = list(self.ops)
+        for i in range(count):
+            for (index, _), values in zip(self.slots, slot_values):
+                parts[index] = str(values[i])
+            results.append("".join(parts))
+        return results
 
     def _parse_template(self, template: str):
-        self.parts = []
+        self.ops = []
         self.random_components = []
-        detection_pattern = re.compile(r"\{[^\}]*\}")
-        parsing_pattern = re.compile(r"\{\s*(\d+)\s*,\s*(\d+)\s*(?:,\s*(\d+)\s*)?\s*\}")
+        self.slots = []
         current_index = 0
-        match_result = detection_pattern.search(template, current_index)
-        while match_result is not None:
+        for match_result in DETECTION_PATTERN.finditer(template):
             match_index = match_result.start()
             if match_index > current_index:
-                self.parts.append(template[current_index : match_index])
-            parsed_result = parsing_pattern.match(template[match_index : match_result.end()])
+                self.ops.append(template[current_index : match_index])
+            parsed_result = PARSING_PATTERN.fullmatch(match_result.group(0))
             if not parsed_result:
                 raise TemplateFormatException(f"Invalid template: {template}")
             parsed_groups = parsed_result.groups()
-            self.parts.append(None)
-            self.random_components.append(RandomComponent(
+            component = RandomComponent(
                 min=int(parsed_groups[0]),
                 max=int(parsed_groups[1]),
                 rounding=int(parsed_groups[2] or 1),
-            ))
+            )
+            if component.min > component.max or component.rounding < 1:
+                raise TemplateFormatException(f"Invalid range in template: {template}")
+            self.slots.append((len(self.ops), component))
+            self.ops.append(component)
+            self.random_components.append(component)
             current_index = match_result.end()
-            match_result = detection_pattern.search(template, current_index)
         if current_index < len(template):
-            self.parts.append(template[current_index:])
+            self.ops.append(template[current_index:])
@@ -3,6 +3,11 @@ import discord
 from discord.ext import commands
 import math
 import asyncio
+from collections import OrderedDict
+import random
+import logging
+import threading
+from typing import Awaitable, Callable, Union
 
 def round_datetime(date: datetime.datetime) -> datetime.datetime:
     discard = datetime.timedelta(microseconds=date.microsecond, seconds=date.second)
@@ -11,6 +16,126 @@ def round_datetime(date: datetime.datetime) -> datetime.datetime:
         result += datetime.timedelta(seconds=60)
     return result
 
+class Clock:
+    # Everything that decides task and vote times reads the time through a clock, so a simulation can substitute virtual time
+    def now(self) -> datetime.datetime:
+        return datetime.datetime.now()
+
+class WeightedSampler:
+    # Fenwick tree over the weights, picking k items without replacement costs O(k log n).
+    # Picked weights are zeroed while sampling and restored afterwards so the tree is built once.
+    def __init__(self, weights: list[int]):
+        self.weights = [max(int(weight), 0) for weight in weights]
+        self.size = len(self.weights)
+        self.total_weight = sum(self.weights)
+        self.tree = [0] * (self.size + 1)
+        for index, weight in enumerate(self.weights):
+            position = index + 1
+            self.tree[position] += weight
+            parent = position + (position & -position)
+            if parent <= self.size:
+                self.tree[parent] += self.tree[position]
+        self.top_bit = 1 << (self.size.bit_length() - 1) if self.size > 0 else 0
+        self.lock = threading.Lock()
+
+    def _add(self, index: int, delta: int):
+        position = index + 1
+        while position <= self.size:
+            self.tree[position] += delta
+            position += position & -position
+
+    def _find(self, target: int) -> int:
+        # Index of the item whose cumulative weight range contains target
+        position = 0
+        bit = self.top_bit
+        while bit > 0:
+            next_position = position + bit
+            if next_position <= self.size and self.tree[next_position] <= target:
+                position = next_position
+                target -= self.tree[next_position]
+            bit >>= 1
+        return position
+
+    def sample(self, k: int, rng: random.Random = random) -> list[int]:
+        with self.lock:
+            remaining_weight = self.total_weight
+            chosen = []
+            try:
+                for _ in range(k):
+                    if remaining_weight <= 0:
+                        raise ValueError("Sample larger than population or is negative")
+                    index = self._find(rng.randrange(remaining_weight))
+                    chosen.append(index)
+                    self._add(index, -self.weights[index])
+                    remaining_weight -= self.weights[index]
+            finally:
+                for index in chosen:
+                    self._add(index, self.weights[index])
+            return chosen
+
+class MessageCache:
+    # Bounded LRU of messages by id, so messages seen on the gateway or sent by the bot don't need a REST fetch
+    def __init__(self, max_size: int = 1000):
+        self.max_size = max_size
+        self.messages: OrderedDict[int, discord.Message] = OrderedDict()
+
+    def add(self, message: discord.Message, replace: bool = True):
+        # The gateway copy of a message is kept up to date by discord.py (e.g. reactions), so it shouldn't be replaced by a REST copy
+        if replace or message.id not in self.messages:
+            self.messages[message.id] = message
+        self.messages.move_to_end(message.id)
+        while len(self.messages) > self.max_size:
+            self.messages.popitem(last=False)
+
+    def get(self, message_id: int) -> Union[discord.Message, None]:
+        message = self.messages.get(int(message_id))
+        if message is not None:
+            self.messages.move_to_end(message.id)
+        return message
+
+    def remove(self, message_id: int):
+        self.messages.pop(int(message_id), None)
+
+class KeyedWorkerPool:
+    # Jobs with the same key always land on the same worker so they run in order, different keys run concurrently.
+    # Queues are bounded so a burst of events applies backpressure instead of growing without limit.
+    def __init__(self, worker_count: int = 8, max_queue_size: int = 1000):
+        self.queues: list[asyncio.Queue] = [asyncio.Queue(maxsize=max_queue_size) for _ in range(max(worker_count, 1))]
+        self.workers: list[asyncio.Task] = []
+
+    def start(self):
+        if not self.workers:
+            self.workers = [asyncio.create_task(self._worker(queue)) for queue in self.queues]
+
+    async def submit(self, key, job: Callable[[], Awaitable[None]]):
+        await self.queues[hash(key) % len(self.queues)].put(job)
+
+    async def _worker(self, queue: asyncio.Queue):
+        while True:
+            job = await queue.get()
+            try:
+                await job()
+            except Exception:
+                logging.exception("Worker job failed")
+            finally:
+                queue.task_done()
+
+DISCORD_MESSAGE_LIMIT = 2000
+
+def chunk_lines(lines: list[str], limit: int = DISCORD_MESSAGE_LIMIT) -> list[str]:
+    # Join lines into as few messages as possible without going over the Discord message limit
+    chunks = []
+    current = ""
+    for line in lines:
+        line = line[:limit]
+        if current and len(current) + 1 + len(line) > limit:
+            chunks.append(current)
+            current = ""
+        current = f"{current}\n{line}" if current else line
+    if current:
+        chunks.append(current)
+    return chunks
+
 g_page_reactions = {
     "◀️": -1,
     "▶️": 1,